@@ -1,13 +1,44 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 from pyproj import Proj
 
+from .GaMMA.gamma import utils as gamma_utils
+from .GaMMA.gamma.seismic_ops import initialize_eikonal
 from .GaMMA.gamma.utils import association, estimate_eps
+from .pickstore import read_picks
+
+# Arrays of the travel-time tables made by GaMMA's initialize_eikonal.
+eikonal_arrays = ['up', 'us', 'grad_up', 'grad_us', 'rgrid', 'zgrid']
+
+# Proj objects of this process, keyed by the center (longitude, latitude).
+_proj_cache: dict = {}
+
+
+def get_proj(center) -> Proj:
+    """## Stereographic projection (km) around the center used by GaMMA.
+
+    The same object is returned for the same center in a process. It takes whole
+    arrays, e.g. ``x, y = proj(lon, lat)`` and ``lon, lat = proj(x, y, inverse=True)``.
+    """
+    key = (float(center[0]), float(center[1]))
+    if key not in _proj_cache:
+        _proj_cache[key] = Proj(
+            f'+proj=sterea +lon_0={key[0]} +lat_0={key[1]} +units=km'
+        )
+    return _proj_cache[key]
 
 
 def config2txt(config, filename):
@@ -16,6 +47,93 @@ def config2txt(config, filename):
             f.write(f'{key},{value}\n')
 
 
+def _eikonal_key(eikonal: dict) -> str:
+    """sha256 of everything the travel-time tables are computed from."""
+    sha = hashlib.sha256()
+    for name in ['z', 'p', 's']:
+        sha.update(np.asarray(eikonal['vel'][name], dtype=np.float64).tobytes())
+    for name in ['xlim', 'ylim', 'zlim']:
+        sha.update(np.asarray(eikonal[name], dtype=np.float64).tobytes())
+    sha.update(np.float64(eikonal['h']).tobytes())
+    return sha.hexdigest()
+
+
+def load_eikonal(eikonal: dict, cache_dir: Path) -> dict:
+    """## Travel-time tables of GaMMA from the on-disk cache, built if missing.
+
+    The tables are stored as ``{cache_dir}/{sha256}/*.npy`` with the sha256 of the
+    velocity model, h, xlim, ylim and zlim, and loaded memory-mapped, so the
+    association workers share the pages of the same files.
+    """
+    table_dir = Path(cache_dir) / _eikonal_key(eikonal)
+    if not (table_dir / 'meta.json').exists():
+        start = time.perf_counter()
+        tables = initialize_eikonal(
+            {k: v for k, v in eikonal.items() if k != 'cache_dir'}
+        )
+        tmp = table_dir.with_name(f'{table_dir.name}.{uuid.uuid4().hex[:8]}.tmp')
+        tmp.mkdir(parents=True)
+        for name in eikonal_arrays:
+            np.save(tmp / f'{name}.npy', tables[name])
+        with open(tmp / 'meta.json', 'w') as f:
+            json.dump({k: float(tables[k]) for k in ['nr', 'nz', 'h']}, f)
+        try:
+            os.rename(tmp, table_dir)
+        except OSError:  # another process saved the same tables first
+            shutil.rmtree(tmp, ignore_errors=True)
+        logging.info(
+            f'Saved eikonal tables {table_dir.name[:12]} '
+            f'({time.perf_counter() - start:.2f} s)'
+        )
+    with open(table_dir / 'meta.json') as f:
+        meta = json.load(f)
+    tables = dict(eikonal, nr=int(meta['nr']), nz=int(meta['nz']), h=meta['h'])
+    for name in eikonal_arrays:
+        tables[name] = np.load(table_dir / f'{name}.npy', mmap_mode='r')
+    return tables
+
+
+def _initialize_eikonal(eikonal: dict) -> dict:
+    """initialize_eikonal of GaMMA, through the cache when it has a cache_dir."""
+    if 'cache_dir' in eikonal:
+        return load_eikonal(eikonal, eikonal['cache_dir'])
+    return initialize_eikonal(eikonal)
+
+
+@contextmanager
+def _eikonal_cache():
+    """
+    association() of GaMMA builds the tables on every call and has no hook for
+    prebuilt ones, so its initialize_eikonal goes through the cache during the call.
+    """
+    original = gamma_utils.initialize_eikonal
+    gamma_utils.initialize_eikonal = _initialize_eikonal
+    try:
+        yield
+    finally:
+        gamma_utils.initialize_eikonal = original
+
+
+def _association(picks, stations, config, event_idx0=0):
+    """GaMMA association with the travel-time tables loaded from the cache."""
+    with _eikonal_cache():
+        return association(picks, stations, config, event_idx0, config['method'])
+
+
+def _associate_window(picks, stations, config, core):
+    """Associate the picks of one window, keeping the events with origin in its core."""
+    events, assignments = _association(picks, stations, config)
+    start, end = core
+    kept = {
+        event['event_index']
+        for event in events
+        if start <= pd.Timestamp(event['time']) < end
+    }
+    events = [event for event in events if event['event_index'] in kept]
+    assignments = [x for x in assignments if x[1] in kept]
+    return events, assignments
+
+
 class GaMMA:
     def __init__(
         self,
@@ -36,6 +154,7 @@ class GaMMA:
         vp=6.0,
         vs=6.0 / 1.75,
         vel_h=1.0,
+        eikonal_cache_dir: Path | None = None,
         use_dbscan=True,
         dbscan_min_sample=3,
         dbscan_eps: float | None = None,
@@ -48,6 +167,13 @@ class GaMMA:
         max_sigma11=2.0,
         max_sigma22=1.0,
         max_sigma12=1.0,
+        start_time: str | None = None,
+        end_time: str | None = None,
+        window_hours: float | None = None,
+        window_overlap: float | None = None,
+        window_processes=1,
+        dedup_seconds=2.0,
+        dedup_km=10.0,
     ):
         """## Configuration of GaMMA
 
@@ -69,6 +195,7 @@ class GaMMA:
             - vp (float, optional): P-wave velocity. Defaults to 6.0.
             - vs (float, optional): S-wave velocity. Defaults to 6.0 / 1.75.
             - vel_h (float, optional): Interval of grid for using velocity to compute travel time. Defaults to 1.0.
+            - eikonal_cache_dir (Path, optional): Directory of the cached travel-time tables. If None, $AUTOQUAKE_EIKONAL_DIR or eikonal_cache in the repo is used. Defaults to None.
             - use_dbscan (bool, optional): Whether to use DBSCAN for outlier removal. Defaults to True.
             - dbscan_min_sample (int, optional): Minimum number of samples in a neighborhood for a point to be considered as a core point of a cluster. Defaults to 3.
             - ncpu (int, optional): Number of CPUs to use. Defaults to 35.
@@ -81,6 +208,14 @@ class GaMMA:
             - max_sigma11 (float, optional): Max phase time residual (s). Defaults to 2.0.
             - max_sigma22 (float, optional): Max phase amplitude residual (in log scale). Defaults to 1.0.
             - max_sigma12 (float, optional): Max covariance term. (Usually not used). Defaults to 1.0.
+            - start_time (str, optional): Only associate picks after this time. Defaults to None.
+            - end_time (str, optional): Only associate picks before this time. Defaults to None.
+            #### These arguements are used for associating the picks in time windows.
+            - window_hours (float, optional): Length of the windows associated separately. If None, all the picks are associated at once. Defaults to None.
+            - window_overlap (float, optional): Overlap (s) added on both sides of a window. If None, the maximum travel time across the study area. Defaults to None.
+            - window_processes (int, optional): Number of windows associated in parallel, ncpu is shared by them. Defaults to 1.
+            - dedup_seconds (float, optional): Max origin time difference (s) of the same event found by two windows. Defaults to 2.0.
+            - dedup_km (float, optional): Max location difference (km) of the same event found by two windows, the one with more picks is kept. Defaults to 10.0.
 
         """
         self.station = station
@@ -100,6 +235,7 @@ class GaMMA:
         self.vel_model = vel_model
         self.vel = {'p': vp, 's': vs}
         self.vel_h = vel_h
+        self.eikonal_cache_dir = self._check_eikonal_cache_dir(eikonal_cache_dir)
         self.use_dbscan = use_dbscan
         self.dbscan_min_sample = dbscan_min_sample
         self.dbscan_eps = dbscan_eps
@@ -112,6 +248,13 @@ class GaMMA:
         self.max_sigma11 = max_sigma11
         self.max_sigma22 = max_sigma22
         self.max_sigma12 = max_sigma12
+        self.start_time = start_time
+        self.end_time = end_time
+        self.window_hours = window_hours
+        self.window_overlap = window_overlap
+        self.window_processes = window_processes
+        self.dedup_seconds = dedup_seconds
+        self.dedup_km = dedup_km
         self.picks = self.result_path / 'gamma_picks.csv'
         self.events = self.result_path / 'gamma_events.csv'
 
@@ -126,12 +269,38 @@ class GaMMA:
         else:
             return Path(__file__).parents[1] / 'vel_model' / 'midas_vel.csv'
 
+    def _check_eikonal_cache_dir(self, eikonal_cache_dir: Path | None) -> Path:
+        if eikonal_cache_dir is not None:
+            return Path(eikonal_cache_dir)
+        return Path(
+            os.environ.get(
+                'AUTOQUAKE_EIKONAL_DIR', Path(__file__).parents[1] / 'eikonal_cache'
+            )
+        )
+
     def _check_pickings(self) -> pd.DataFrame:
         """
         Rename the dataframe and removing the invalid amplitude (-1)
         if use_amplitude == True.
+
+        The pickings can be a csv, a picks.parquet or a pick store directory. Only
+        the picks between start_time and end_time are read, and Parquet inputs only
+        load the columns needed for the association.
+        """
+        columns = None
+        if Path(self.pickings).suffix != '.csv':
+            columns = ['station_id', 'phase_time', 'phase_type', 'phase_score']
+            if self.use_amplitude:
+                columns += ['amp', 'phase_amplitude']
+        df = read_picks(
+            self.pickings, columns=columns, start=self.start_time, end=self.end_time
+        )
+        return self._format_picks(df)
+
+    def _format_picks(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Rename the picker columns into the ones of GaMMA.
         """
-        df = pd.read_csv(self.pickings)
         if self.picking_name_extract is not None:
             df['station_id'] = df['station_id'].map(self.picking_name_extract)
 
@@ -250,17 +419,14 @@ class GaMMA:
             (None, None),  # t
         )
 
-        proj = Proj(
-            f"+proj=sterea +lon_0={config['center'][0]} +lat_0={config['center'][1]} +units=km"
-        )
-        self.proj = proj
-        self.df_station[['x(km)', 'y(km)']] = self.df_station.apply(
-            lambda x: pd.Series(proj(longitude=x.longitude, latitude=x.latitude)),
-            axis=1,
-        )
-        self.df_station['z(km)'] = self.df_station['elevation'].apply(
-            lambda x: -x / 1e3
+        self.proj = get_proj(config['center'])
+        station_x, station_y = self.proj(
+            longitude=self.df_station['longitude'].to_numpy(),
+            latitude=self.df_station['latitude'].to_numpy(),
         )
+        self.df_station['x(km)'] = station_x
+        self.df_station['y(km)'] = station_y
+        self.df_station['z(km)'] = -self.df_station['elevation'] / 1e3
 
         if config['method'] == 'BGMM':  ## BayesianGaussianMixture
             config['oversample_factor'] = 5
@@ -276,7 +442,10 @@ class GaMMA:
             'xlim': config['x(km)'],
             'ylim': config['y(km)'],
             'zlim': config['z(km)'],
+            'cache_dir': str(self.eikonal_cache_dir),
         }
+        # build the tables once here, association and its workers map the files
+        load_eikonal(config['eikonal'], self.eikonal_cache_dir)
 
         self._check_dbscan(config)
 
@@ -286,30 +455,167 @@ class GaMMA:
 
         self.config = config
 
+    def _max_travel_time(self) -> float:
+        """
+        S-wave travel time (s) along the diagonal of the study area with the
+        slowest velocity of the model, the longest an event takes to be picked.
+        """
+        config = self.config
+        vel = config['eikonal']['vel'] if config.get('eikonal') else self.vel
+        distance = np.sqrt(
+            np.ptp(config['x(km)']) ** 2
+            + np.ptp(config['y(km)']) ** 2
+            + np.ptp(config['z(km)']) ** 2
+        )
+        return float(distance / np.min(vel['s']))
+
+    def _time_windows(self) -> list:
+        """
+        Split the picks into windows of window_hours, each extended by the overlap
+        on both sides, so every pick of an event with origin in the core is inside.
+        Returns the (picks, (core_start, core_end)) of the windows with enough picks.
+        """
+        if self.window_overlap is None:
+            self.window_overlap = self._max_travel_time()
+        overlap = pd.Timedelta(seconds=self.window_overlap)
+        width = pd.Timedelta(hours=self.window_hours)
+        times = pd.to_datetime(self.df_picks['timestamp'])
+        windows = []
+        # origins come before the picks, the first core has to start an overlap early
+        first = (times.min() - overlap).floor('h')
+        starts = pd.date_range(first, times.max(), freq=width)
+        for start in starts:
+            mask = (times >= start - overlap) & (times < start + width + overlap)
+            if mask.sum() >= self.min_picks_per_eq:
+                windows.append((self.df_picks[mask], (start, start + width)))
+        logging.info(
+            f'{len(windows)} windows of {self.window_hours} h, '
+            f'overlap {self.window_overlap:.1f} s'
+        )
+        return windows
+
+    def _duplicated_events(self, events: pd.DataFrame) -> np.ndarray:
+        """
+        Mark the events found again by another window, within dedup_seconds and
+        dedup_km, keeping the one with more picks. The events are sorted by origin.
+
+        The candidate pairs come from a search in the sorted origins, only the
+        pairs that are duplicates are resolved in order, the earlier event first.
+        """
+        origin = events['origin'].to_numpy()
+        xyz = events[['x(km)', 'y(km)', 'z(km)']].to_numpy()
+        window = events['window'].to_numpy()
+        num_picks = events['num_picks'].to_numpy()
+        tolerance = np.timedelta64(int(self.dedup_seconds * 1e6), 'us')
+        drop = np.zeros(len(events), dtype=bool)
+        # every event i is paired with the later events up to origin[i] + tolerance
+        end = np.searchsorted(origin, origin + tolerance, side='right')
+        counts = end - np.arange(len(events)) - 1
+        i = np.repeat(np.arange(len(events)), counts)
+        offset = np.repeat(np.cumsum(counts) - counts, counts)  # first pair of i
+        j = i + 1 + np.arange(len(i)) - offset
+        close = (window[i] != window[j]) & (
+            np.linalg.norm(xyz[j] - xyz[i], axis=1) <= self.dedup_km
+        )
+        for i_, j_ in zip(i[close], j[close]):
+            if not drop[i_] and not drop[j_]:
+                drop[j_ if num_picks[i_] >= num_picks[j_] else i_] = True
+        return drop
+
+    def _merge_windows(self, results: list):
+        """
+        Merge the events and assignments of the windows, renumbering the events by
+        origin time. A pick claimed by two windows keeps its best scored event.
+        """
+        events, assignments = [], []
+        for k, (events_, assignments_) in enumerate(results):
+            events.extend(dict(event, window=k) for event in events_)
+            assignments.extend((*x, k) for x in assignments_)
+        if not events:
+            return [], []
+        events = pd.DataFrame(events)
+        events['origin'] = pd.to_datetime(events['time'])
+        events = events.sort_values('origin', kind='stable', ignore_index=True)
+        drop = self._duplicated_events(events)
+        logging.info(f'Dropped {drop.sum()} events duplicated in the overlaps')
+        events = events[~drop].reset_index(drop=True)
+        new_index = pd.Series(
+            np.arange(len(events)),
+            index=pd.MultiIndex.from_frame(events[['window', 'event_index']]),
+            name='new_index',
+        )
+        assignments = (
+            pd.DataFrame(
+                assignments,
+                columns=['pick_index', 'event_index', 'gamma_score', 'window'],
+            )
+            .join(new_index, on=['window', 'event_index'], how='inner')
+            .sort_values('gamma_score', ascending=False, kind='stable')
+            .drop_duplicates('pick_index')
+            .sort_values('pick_index')
+        )
+        events['event_index'] = events.index
+        events = events.drop(columns=['window', 'origin']).to_dict('records')
+        assignments = list(
+            assignments[['pick_index', 'new_index', 'gamma_score']].itertuples(
+                index=False, name=None
+            )
+        )
+        return events, assignments
+
+    def _associate_windows(self):
+        """
+        Associate the time windows in a process pool, ncpu is split among them.
+        With a single window process they run one after another in this process.
+        """
+        windows = self._time_windows()
+        config = dict(self.config, ncpu=max(1, self.ncpu // self.window_processes))
+        if self.window_processes == 1:
+            results = self._window_results(
+                windows,
+                (
+                    _associate_window(picks, self.df_station, config, core)
+                    for picks, core in windows
+                ),
+            )
+            return self._merge_windows(results)
+        with ProcessPoolExecutor(max_workers=self.window_processes) as executor:
+            futures = [
+                executor.submit(_associate_window, picks, self.df_station, config, core)
+                for picks, core in windows
+            ]
+            results = self._window_results(
+                windows, (future.result() for future in futures)
+            )
+        return self._merge_windows(results)
+
+    @staticmethod
+    def _window_results(windows: list, results) -> list:
+        """Collect the results of the windows in order, logging each of them."""
+        collected = []
+        for (picks, core), result in zip(windows, results):
+            collected.append(result)
+            logging.info(
+                f'Window {core[0]}: {len(result[0])} events from {len(picks)} picks'
+            )
+        return collected
+
     def run_predict(self):
         self.config_gamma()
         self.df_picks = self._check_pickings()
         # logging.info(f'picks_num: {self.df_picks.head(10)}')
         event_idx0 = 0  ## current earthquake index
         assignments = []
-        events, assignments = association(
-            self.df_picks,
-            self.df_station,
-            self.config,
-            event_idx0,
-            self.config['method']
-        )
+        if self.window_hours is None:
+            events, assignments = _association(
+                self.df_picks, self.df_station, self.config, event_idx0
+            )
+        else:
+            events, assignments = self._associate_windows()
         event_idx0 += len(events)
         logging.info(f'event_num: {event_idx0}')
         ## create catalogs
-        events = pd.DataFrame(events)
-        events[['longitude', 'latitude']] = events.apply(
-            lambda x: pd.Series(
-                self.proj(longitude=x['x(km)'], latitude=x['y(km)'], inverse=True)
-            ),
-            axis=1,
-        )
-        events['depth_km'] = events['z(km)']
+        events = self._event_catalog(pd.DataFrame(events))
         events.to_csv(
             self.result_path / 'gamma_events.csv',
             index=False,
@@ -318,11 +624,35 @@ class GaMMA:
         )
 
         ## add assignment to picks
+        picks = self._pick_catalog(self.df_picks, assignments)
+        picks.to_csv(
+            self.result_path / 'gamma_picks.csv',
+            index=False,
+            date_format='%Y-%m-%dT%H:%M:%S.%f',
+        )
+
+    def _event_catalog(self, events: pd.DataFrame) -> pd.DataFrame:
+        """
+        Add the longitude, latitude and depth_km of the GaMMA events.
+        """
+        events['longitude'], events['latitude'] = self.proj(
+            longitude=events['x(km)'].to_numpy(),
+            latitude=events['y(km)'].to_numpy(),
+            inverse=True,
+        )
+        events['depth_km'] = events['z(km)']
+        return events
+
+    def _pick_catalog(self, df_picks: pd.DataFrame, assignments: list) -> pd.DataFrame:
+        """
+        Join the assignments to the picks and rename the columns back, picks
+        without event get event_index -1.
+        """
         assignments = pd.DataFrame(
             assignments, columns=['pick_index', 'event_index', 'gamma_score']
         )
         picks = (
-            self.df_picks.join(assignments.set_index('pick_index'))
+            df_picks.join(assignments.set_index('pick_index'))
             .fillna(-1)
             .astype({'event_index': int})
         )
@@ -336,11 +666,7 @@ class GaMMA:
             },
             inplace=True,
         )
-        picks.to_csv(
-            self.result_path / 'gamma_picks.csv',
-            index=False,
-            date_format='%Y-%m-%dT%H:%M:%S.%f',
-        )
+        return picks
 
     @staticmethod
     def classify_event(row, picks):
@@ -381,12 +707,198 @@ class GaMMA:
         row['event_type'] = event_type
         return row
 
-    # Apply function to each row in df_events
+    @staticmethod
+    def count_event_picks(df_picks: pd.DataFrame) -> pd.DataFrame:
+        """
+        Seismometer and DAS P/S pick counts of every event_index in one groupby,
+        DAS station_id have a digit as second character, seismometers a letter.
+        """
+        second = df_picks['station_id'].str[1]
+        instrument = np.where(
+            second.str.isdigit().fillna(False).astype(bool),
+            'das',
+            np.where(second.str.isalpha().fillna(False).astype(bool), 'seis', None),
+        )
+        columns = {
+            ('seis', 'P'): 'seis_p_picks',
+            ('seis', 'S'): 'seis_s_picks',
+            ('das', 'P'): 'das_p_picks',
+            ('das', 'S'): 'das_s_picks',
+        }
+        counts = (
+            df_picks.assign(instrument=instrument)
+            .groupby(['event_index', 'instrument', 'phase_type'])
+            .size()
+            .unstack(['instrument', 'phase_type'], fill_value=0)
+            .reindex(columns=pd.MultiIndex.from_tuples(columns), fill_value=0)
+        )
+        counts.columns = list(columns.values())
+        return counts
+
     @staticmethod
     def get_detailed_picks(gamma_events: Path, gamma_picks: Path):
+        """
+        Add the pick counts of classify_event to every event, computed for all the
+        events at once, with the event_type:
+        1 (seismometer and DAS), 2 (seismometer), 3 (DAS) or 4 (neither).
+        """
         df_events = pd.read_csv(gamma_events)
         df_picks = pd.read_csv(gamma_picks)
-        df_events = df_events.apply(
-            lambda row: GaMMA.classify_event(row, df_picks), axis=1
+        counts = GaMMA.count_event_picks(df_picks).reindex(
+            df_events['event_index'], fill_value=0
         )
+        for column in counts.columns:
+            df_events[column] = counts[column].to_numpy()
+        seis = (df_events['seis_p_picks'] >= 6) & (df_events['seis_s_picks'] >= 2)
+        das = df_events['das_p_picks'] >= 15
+        df_events['event_type'] = np.select([seis & das, seis, das], [1, 2, 3], 4)
         return df_events
+
+
+class IncrementalGaMMA(GaMMA):
+    """## Online GaMMA association of picks arriving in batches.
+
+    The unassociated picks are kept in a buffer and associated again with every
+    new batch. An event is final once the latest pick is more than finalize_lag
+    after its origin, all its picks have arrived by then. Final events get the
+    next event_index, which never changes, and are appended with their picks to
+    gamma_events.csv and gamma_picks.csv, their picks leave the buffer. Picks that
+    can no longer join an event are appended with event_index -1.
+
+    The instance can be given as the ``on_picks`` callback of ``PhaseNet.run_stream``.
+
+    ### Args:
+        - station (Path): Path to the station file.
+        - result_path (Path, optional): Path to the result directory. Defaults to None.
+        - finalize_lag (float, optional): Seconds after its origin an event is final. If None, the maximum travel time across the study area. Defaults to None.
+        - kwargs: Other arguments of GaMMA.
+    """
+
+    def __init__(
+        self,
+        station: Path,
+        result_path=None,
+        finalize_lag: float | None = None,
+        **kwargs,
+    ):
+        super().__init__(
+            station=station, pickings=None, result_path=result_path, **kwargs
+        )
+        self.config_gamma()
+        if finalize_lag is None:
+            finalize_lag = self._max_travel_time()
+        self.finalize_lag = finalize_lag
+        self.buffer = pd.DataFrame()
+        self.latest = None
+        self.next_pick_index = 0
+        self.next_event_index = 0
+        if self.events.exists():  # keep numbering after a restart
+            event_index = pd.read_csv(self.events, usecols=['event_index'])
+            if not event_index.empty:
+                self.next_event_index = int(event_index['event_index'].max()) + 1
+        self.recent = pd.DataFrame()  # final events a duplicate could be found of
+
+    def __call__(self, picks: pd.DataFrame) -> pd.DataFrame:
+        return self.add_picks(picks)
+
+    def add_picks(self, picks: pd.DataFrame) -> pd.DataFrame:
+        """## Add a batch of picks, returns the events that became final."""
+        if not picks.empty:
+            picks = self._format_picks(picks.copy())
+            picks['timestamp'] = pd.to_datetime(picks['timestamp'])
+            picks.index = np.arange(
+                self.next_pick_index, self.next_pick_index + len(picks)
+            )
+            self.next_pick_index += len(picks)
+            self.buffer = pd.concat([self.buffer, picks])
+            latest = picks['timestamp'].max()
+            self.latest = latest if self.latest is None else max(self.latest, latest)
+        if self.latest is None:
+            return pd.DataFrame()
+        return self._emit(self.latest - pd.Timedelta(seconds=self.finalize_lag))
+
+    def flush(self) -> pd.DataFrame:
+        """## Emit all the events of the buffer, e.g. when the stream ends."""
+        return self._emit(None)
+
+    def _duplicated_final(self, events: pd.DataFrame) -> np.ndarray:
+        """Events within dedup_seconds and dedup_km of an event already final."""
+        if self.recent.empty or events.empty:
+            return np.zeros(len(events), dtype=bool)
+        dims = ['x(km)', 'y(km)', 'z(km)']
+        dt = np.abs(
+            events['origin'].to_numpy()[:, None]
+            - self.recent['origin'].to_numpy()[None, :]
+        )
+        distance = np.linalg.norm(
+            events[dims].to_numpy()[:, None] - self.recent[dims].to_numpy()[None],
+            axis=-1,
+        )
+        tolerance = np.timedelta64(int(self.dedup_seconds * 1e6), 'us')
+        return ((dt <= tolerance) & (distance <= self.dedup_km)).any(axis=1)
+
+    def _emit(self, final_until: pd.Timestamp | None) -> pd.DataFrame:
+        """
+        Associate the buffer and write the events with origin before final_until,
+        all of them if None.
+        """
+        events, assignments = pd.DataFrame(), []
+        if len(self.buffer) >= self.min_picks_per_eq:
+            events, assignments = _association(
+                self.buffer, self.df_station, self.config
+            )
+            events = pd.DataFrame(events)
+        if not events.empty:
+            events['origin'] = pd.to_datetime(events['time'])
+            if final_until is not None:
+                events = events[events['origin'] <= final_until]
+            events = events[~self._duplicated_final(events)]
+            events = events.sort_values('origin', kind='stable', ignore_index=True)
+        new_index = dict(
+            zip(
+                events.get('event_index', []),
+                range(self.next_event_index, self.next_event_index + len(events)),
+            )
+        )
+        self.next_event_index += len(events)
+        assignments = [
+            (pick, new_index[event], score)
+            for pick, event, score in assignments
+            if event in new_index
+        ]
+        assigned = self.buffer.index.isin([pick for pick, _, _ in assignments])
+        # picks too old for any event that is not final yet
+        stale = ~assigned
+        if final_until is not None:
+            cutoff = final_until - pd.Timedelta(seconds=self.finalize_lag)
+            stale &= (self.buffer['timestamp'] < cutoff).to_numpy()
+        picks = self._pick_catalog(self.buffer[assigned | stale], assignments)
+        self.buffer = self.buffer[~(assigned | stale)]
+
+        if not events.empty:
+            events['event_index'] = events['event_index'].map(new_index)
+            self.recent = pd.concat([self.recent, events], ignore_index=True)
+            events = self._event_catalog(events.drop(columns=['origin']))
+            events.to_csv(
+                self.events,
+                mode='a',
+                header=not self.events.exists(),
+                index=False,
+                float_format='%.3f',
+                date_format='%Y-%m-%dT%H:%M:%S.%f',
+            )
+            logging.info(
+                f'{len(events)} final events, {len(self.buffer)} picks buffered'
+            )
+        if not picks.empty:
+            picks.sort_values('phase_time', kind='stable').to_csv(
+                self.picks,
+                mode='a',
+                header=not self.picks.exists(),
+                index=False,
+                date_format='%Y-%m-%dT%H:%M:%S.%f',
+            )
+        if not self.recent.empty and self.latest is not None:
+            keep = self.latest - pd.Timedelta(seconds=3 * self.finalize_lag)
+            self.recent = self.recent[self.recent['origin'] >= keep]
+        return events
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import h5py
+import numpy as np
+from obspy import Trace, UTCDateTime
+
+# Settings compared by default, every one is a separate run of run_predict.
+default_configs = [
+    {'batch_size': 1, 'workers': 0, 'processes': 1},
+    {'batch_size': 4, 'workers': 0, 'processes': 1},
+    {'batch_size': 4, 'workers': 2, 'processes': 1},
+    {'batch_size': 4, 'workers': 0, 'processes': 2},
+]
+
+
+def _ricker(nt: int, center: int, width: float) -> np.ndarray:
+    t = (np.arange(nt) - center) / width
+    return (1 - 2 * t**2) * np.exp(-(t**2))
+
+
+def _synthetic_trace(
+    nt: int, events: np.ndarray, rng: np.random.Generator, sampling_rate: float
+) -> np.ndarray:
+    """Gaussian noise with a P and an S wavelet for every event sample."""
+    data = rng.normal(0.0, 1.0, nt).astype(np.float32)
+    for onset in events:
+        for lag, amp, width in [(0.0, 8.0, 5.0), (3.0, 16.0, 10.0)]:
+            center = int(onset + lag * sampling_rate)
+            lo, hi = max(0, center - 200), min(nt, center + 200)
+            if lo < hi:
+                data[lo:hi] += amp * _ricker(hi - lo, center - lo, width)
+    return data
+
+
+def make_sac_day(
+    data_dir: Path,
+    ymd='20240101',
+    n_stations=4,
+    hours=1.0,
+    sampling_rate=100.0,
+    events_per_hour=6,
+    seed=0,
+) -> Path:
+    """## Write one day of synthetic 3-component SAC files.
+
+    Files follow ``{net}.{sta}.{loc}.{cha}.D.{year}.{jday}.000000.SAC`` in
+    ``data_dir/ymd``, which is how ``PhaseNet`` builds its data_list.
+
+    ### Args:
+        - data_dir (Path): Parent directory of the day directories.
+        - ymd (str, optional): Day of the data. Defaults to '20240101'.
+        - n_stations (int, optional): Number of stations. Defaults to 4.
+        - hours (float, optional): Length of every trace. Defaults to 1.0.
+        - sampling_rate (float, optional): Sampling rate (Hz). Defaults to 100.0.
+        - events_per_hour (int, optional): Synthetic events inserted per hour. Defaults to 6.
+        - seed (int, optional): Seed of the noise. Defaults to 0.
+    """
+    rng = np.random.default_rng(seed)
+    day_dir = Path(data_dir) / ymd
+    day_dir.mkdir(parents=True, exist_ok=True)
+    start = UTCDateTime(datetime.strptime(ymd, '%Y%m%d'))
+    nt = int(hours * 3600 * sampling_rate)
+    events = rng.integers(0, nt, max(1, int(events_per_hour * hours)))
+    for i in range(n_stations):
+        station = f'S{i:03d}'
+        # later stations see the events later, like a moveout
+        moveout = events + int(i * 0.5 * sampling_rate)
+        for channel in ['HHE', 'HHN', 'HHZ']:
+            tr = Trace(
+                _synthetic_trace(nt, moveout, rng, sampling_rate),
+                header={
+                    'network': 'BM',
+                    'station': station,
+                    'location': '00',
+                    'channel': channel,
+                    'sampling_rate': sampling_rate,
+                    'starttime': start,
+                },
+            )
+            day = f'{start.year}.{start.julday:03d}'
+            name = f'BM.{station}.00.{channel}.D.{day}.000000.SAC'
+            tr.write(str(day_dir / name), format='SAC')
+    return day_dir
+
+
+def make_das_day(
+    data_dir: Path,
+    ymd='20240101',
+    n_files=2,
+    nx=1024,
+    seconds=300.0,
+    dt=0.01,
+    dx=10.0,
+    events_per_file=2,
+    seed=0,
+) -> Path:
+    """## Write synthetic MiDAS-style hdf5 files of one day.
+
+    Every file holds a ``data`` dataset of shape [nx, nt] with the ``dt_s``, ``dx_m``
+    and ``begin_time`` attributes, named ``MiDAS_{ymd}_{start}_{end}.h5``.
+
+    ### Args:
+        - data_dir (Path): Parent directory of the day directories.
+        - ymd (str, optional): Day of the data. Defaults to '20240101'.
+        - n_files (int, optional): Number of consecutive files. Defaults to 2.
+        - nx (int, optional): Number of channels. Defaults to 1024.
+        - seconds (float, optional): Length of every file. Defaults to 300.0.
+        - dt (float, optional): Sampling interval (s). Defaults to 0.01.
+        - dx (float, optional): Channel spacing (m). Defaults to 10.0.
+        - events_per_file (int, optional): Synthetic events inserted per file. Defaults to 2.
+        - seed (int, optional): Seed of the noise. Defaults to 0.
+    """
+    rng = np.random.default_rng(seed)
+    day_dir = Path(data_dir) / ymd
+    day_dir.mkdir(parents=True, exist_ok=True)
+    day_start = datetime.strptime(ymd, '%Y%m%d')
+    nt = int(seconds / dt)
+    for k in range(n_files):
+        begin = int(k * seconds)
+        data = rng.normal(0.0, 1.0, (nx, nt)).astype(np.float32)
+        for onset in rng.integers(0, nt, events_per_file):
+            # straight moveout along the fibre
+            delays = onset + (np.arange(nx) * dx / 3000.0 / dt).astype(int)
+            for x, delay in enumerate(delays):
+                lo, hi = max(0, delay - 100), min(nt, delay + 100)
+                if lo < hi:
+                    data[x, lo:hi] += 8.0 * _ricker(hi - lo, delay - lo, 5.0)
+        path = day_dir / f'MiDAS_{ymd}_{begin}_{begin + int(seconds)}.h5'
+        with h5py.File(path, 'w') as fp:
+            ds = fp.create_dataset('data', data=data)
+            ds.attrs['dt_s'] = dt
+            ds.attrs['dx_m'] = dx
+            ds.attrs['begin_time'] = (
+                UTCDateTime(day_start) + begin
+            ).strftime('%Y-%m-%dT%H:%M:%S.%f')
+    return day_dir
+
+
+def _peak_rss_mb() -> float:
+    """Peak RSS of this process and its finished children (ru_maxrss is in kB)."""
+    scale = 1 / 1024 if platform.system() != 'Darwin' else 1 / 1024**2
+    return scale * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def _run_config(data_dir: str, result_path: str, ymd: str, picker_kwargs: dict):
+    """Run one picker setting; executed in a fresh process to isolate peak RSS."""
+    from .picker import PhaseNet
+
+    picker_kwargs = dict(picker_kwargs)
+    processes = picker_kwargs.pop('processes', 1)
+    phasenet = PhaseNet(
+        data_parent_dir=Path(data_dir),
+        start_ymd=ymd,
+        end_ymd=ymd,
+        result_path=Path(result_path),
+        **picker_kwargs,
+    )
+    start = time.perf_counter()
+    stages = phasenet.run_predict(processes=processes)
+    wall = time.perf_counter() - start
+    return {'wall_s': wall, 'peak_rss_mb': _peak_rss_mb(), 'stages_s': stages}
+
+
+def run_benchmark(
+    work_dir: Path,
+    data='sac',
+    configs: list | None = None,
+    ymd='20240101',
+    n_stations=4,
+    hours=1.0,
+    n_files=2,
+    nx=1024,
+    seconds=300.0,
+    **picker_kwargs,
+) -> dict:
+    """## Measure the picker throughput on synthetic data.
+
+    Every config (PhaseNet arguments plus ``processes`` of run_predict) runs on
+    CPU in its own process. The report gives the throughput in station-hours (or
+    channel-hours for DAS) per second, the peak RSS and the stage breakdown of
+    run_predict: model_load, data (read and preprocess), forward, postprocess
+    (peaks and picks) and write, summed over the workers. It is saved as
+    ``work_dir/benchmark_{data}.json``.
+
+    ### Args:
+        - work_dir (Path): Directory of the synthetic data, results and report.
+        - data (str, optional): 'sac' for seismometer or 'das' for hdf5 data. Defaults to 'sac'.
+        - configs (list | None, optional): Settings to compare. If None, ``default_configs``. Defaults to None.
+        - ymd (str, optional): Day of the synthetic data. Defaults to '20240101'.
+        - n_stations (int, optional): SAC only. Number of stations. Defaults to 4.
+        - hours (float, optional): SAC only. Length of every trace. Defaults to 1.0.
+        - n_files (int, optional): DAS only. Number of hdf5 files. Defaults to 2.
+        - nx (int, optional): DAS only. Number of channels. Defaults to 1024.
+        - seconds (float, optional): DAS only. Length of every file. Defaults to 300.0.
+        - picker_kwargs: Other PhaseNet arguments shared by all the configs.
+    """
+    work_dir = Path(work_dir)
+    data_dir = work_dir / f'data_{data}'
+    if data == 'sac':
+        make_sac_day(data_dir, ymd, n_stations=n_stations, hours=hours)
+        defaults = {'format': 'SAC', 'model': 'phasenet'}
+        units, size = 'station_hours', n_stations * hours
+    elif data == 'das':
+        make_das_day(data_dir, ymd, n_files=n_files, nx=nx, seconds=seconds)
+        defaults = {'format': 'h5', 'model': 'phasenet_das'}
+        units, size = 'channel_hours', nx * n_files * seconds / 3600
+    else:
+        raise ValueError(f'Unknown benchmark data {data}, please use sac or das')
+    defaults.update(device='cpu', **picker_kwargs)
+
+    report = {
+        'data': data,
+        'size': {units: size},
+        'cpu_count': os.cpu_count(),
+        'platform': platform.platform(),
+        'runs': [],
+    }
+    for i, config in enumerate(configs or default_configs):
+        result_path = work_dir / 'results' / f'{data}_{i:02d}'
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context('spawn')
+        ) as executor:
+            run = executor.submit(
+                _run_config,
+                str(data_dir),
+                str(result_path),
+                ymd,
+                {**defaults, **config},
+            ).result()
+        run['config'] = config
+        run[f'{units}_per_s'] = size / run['wall_s']
+        logging.info(f'Benchmark {config}: {run}')
+        report['runs'].append(run)
+
+    with open(work_dir / f'benchmark_{data}.json', 'w') as f:
+        json.dump(report, f, indent=4)
+    return report
@@ -12,7 +12,9 @@ import numpy as np
 import pandas as pd
 from obspy import Stream, UTCDateTime, read
 from obspy.io.sac.sacpz import attach_paz
+from scipy.signal import detrend
 
+from .pickstore import amplitude_columns, amplitude_windows, read_picks
 from .utils import dmm_trans
 
 pre_filt = (0.1, 0.5, 30, 35)
@@ -25,6 +27,139 @@ wa_simulate = {
 }
 
 
+def _horizontal_channels(channels: set[str]) -> dict:
+    """Pick the E/N (or 1/2) channels with the same priority as Magnitude."""
+    horizontal = {}
+    for axis, ends in [('e', ['E', '1']), ('n', ['N', '2'])]:
+        for end in ends:
+            matched = sorted(c for c in channels if c[-1] == end)
+            if matched:
+                horizontal[axis] = matched[0]
+                break
+    return horizontal
+
+
+def _window(tr, t1: UTCDateTime, t2: UTCDateTime) -> np.ndarray | None:
+    """Samples of ``tr.trim(t1, t2)``, None if the trace does not cover the window."""
+    start, delta = tr.stats.starttime, tr.stats.delta
+    if t1 < start or t2 > tr.stats.endtime:
+        return None
+    i0 = round((t1 - start) / delta)
+    i1 = round((t2 - start) / delta) + 1
+    return tr.data[i0:i1]
+
+
+def _wood_anderson(
+    tr, pz_file: Path, t1: UTCDateTime, t2: UTCDateTime, margin: float
+) -> tuple[np.ndarray, np.ndarray] | None:
+    """Wood-Anderson samples of one window the way ``_find_max_amp`` computes them.
+
+    The trace is cut ``margin`` s around the window, simulated with the default
+    taper and, for code 2, bandpassed before the window is cut out. Returns the
+    code 1 and code 2 samples of the window, None if the margin is not covered.
+    """
+    if t1 - margin < tr.stats.starttime or t2 + margin > tr.stats.endtime:
+        return None
+    segment = tr.slice(t1 - margin, t2 + margin).copy()
+    attach_paz(tr=segment, paz_file=str(pz_file))
+    segment.simulate(paz_remove='self', paz_simulate=wa_simulate, pre_filt=pre_filt)
+    bandpassed = segment.copy().filter('bandpass', freqmin=1, freqmax=25)
+    return _window(segment, t1, t2), _window(bandpassed, t1, t2)
+
+
+def _pair_times(phase_times: list, phase_types: list | None) -> list:
+    """The first S pick less than 37.5 s after every P pick, else None."""
+    pairs = [None] * len(phase_times)
+    if phase_types is None:
+        return pairs
+    times = [UTCDateTime(t) for t in phase_times]
+    s_times = sorted(t for t, phase in zip(times, phase_types) if phase == 'S')
+    for i, (t, phase) in enumerate(zip(times, phase_types)):
+        if phase != 'P':
+            continue
+        later = [s for s in s_times if 0 < s - t and (s - t) * 2 + 5 < 80]
+        if later:
+            pairs[i] = later[0]
+    return pairs
+
+
+def peak_amplitudes(
+    st: Stream,
+    phase_times: list,
+    pz_dir: Path | None = None,
+    phase_types: list | None = None,
+    before=3.0,
+    margin=100.0,
+) -> pd.DataFrame:
+    """
+    Peak horizontal amplitudes in the Magnitude windows around the picks of one station.
+
+    For every pick and every length in ``amplitude_windows`` the window runs from
+    ``before`` s ahead of the pick over that length, as in
+    ``Magnitude._calculate_time_window``. With phase_types a P pick followed by an
+    S pick within 37.5 s also gets the ``pair`` window of that S pick.
+    ``amp_*`` and ``amp_detrend_*`` are the peaks of the raw and the demeaned,
+    linearly detrended E/N traces used by ``_kinethreshold``. With PZ files in
+    pz_dir the Wood-Anderson peaks of ``_find_max_amp`` are added,
+    ``wa_amp_{axis}_*`` for code 1 and ``wa_bp_amp_{axis}_*`` (bandpassed) for
+    code 2. Every window is simulated on its own with ``margin`` s on both sides,
+    like Magnitude does per event, so the values match it up to float rounding.
+    Windows the trace does not fully cover stay NaN.
+
+    Returns:
+        pd.DataFrame: One row per pick with the ``amplitude_columns``.
+    """
+    result = pd.DataFrame(
+        np.nan, index=range(len(phase_times)), columns=amplitude_columns
+    )
+    result['instrument'] = None
+    pairs = _pair_times(phase_times, phase_types)
+    result['pair_time'] = pd.to_datetime(
+        [None if s is None else s.datetime for s in pairs]
+    )
+    horizontal = _horizontal_channels({tr.stats.channel for tr in st})
+    if len(horizontal) < 2:
+        return result
+    windows = []  # (row, column suffix, t1, t2)
+    for i, (t, s) in enumerate(zip(phase_times, pairs)):
+        t1 = UTCDateTime(t) - before
+        windows += [(i, length, t1, t1 + length) for length in amplitude_windows]
+        if s is not None:
+            windows.append((i, 'pair', t1, t1 + (s - UTCDateTime(t)) * 2 + 5))
+    peaks = {}
+    for axis, channel in horizontal.items():
+        tr = st.select(channel=channel).merge(fill_value='latest')[0]
+        result['instrument'] = channel[:2]
+        pz_files = [] if pz_dir is None else list(
+            Path(pz_dir).glob(f'*{tr.stats.station}*{channel}*')
+        )
+        for i, suffix, t1, t2 in windows:
+            data = _window(tr, t1, t2)
+            if data is None or len(data) < 2:
+                continue
+            peaks['amp', axis, i, suffix] = np.abs(data).max()
+            peaks['amp_detrend', axis, i, suffix] = np.abs(
+                detrend(data.astype(np.float64))
+            ).max()
+            if not pz_files:
+                continue
+            simulated = _wood_anderson(tr, pz_files[0], t1, t2, margin)
+            if simulated is not None:
+                peaks['wa_amp', axis, i, suffix] = np.abs(simulated[0]).max()
+                peaks['wa_bp_amp', axis, i, suffix] = np.abs(simulated[1]).max()
+    for i, suffix, _, _ in windows:
+        for name in ['amp', 'amp_detrend']:  # _kinethreshold takes both components
+            values = [peaks.get((name, axis, i, suffix)) for axis in ['e', 'n']]
+            if None not in values:
+                result.loc[i, f'{name}_{suffix}'] = max(values)
+        for name in ['wa_amp', 'wa_bp_amp']:
+            for axis in ['e', 'n']:
+                value = peaks.get((name, axis, i, suffix))
+                if value is not None:
+                    result.loc[i, f'{name}_{axis}_{suffix}'] = value
+    return result
+
+
 def check_time(year: int, month: int, day: int, hour: int, min: int, sec: float):
     """
     Adjust time by handling overflow of minutes, hours, and days.
@@ -113,6 +248,7 @@ class Magnitude:
         sac_parent_dir: Path,
         pz_dir: Path,
         output_dir: Path | None = None,
+        pick_amplitudes: Path | None = None,
     ):
         self.dout_file = dout_file
         self.station_info = station
@@ -121,6 +257,9 @@ class Magnitude:
         self.output_dir = self._check_output(output_dir)
         self.events = self.output_dir / 'mag_events.csv'
         self.picks = self.output_dir / 'mag_picks.csv'
+        # picks with the amplitude columns of PhaseNet(pick_amplitude=True)
+        self.pick_amplitudes = pick_amplitudes
+        self.amplitudes = None
 
     def _check_output(self, output):
         if output is not None:
@@ -320,9 +459,19 @@ class Magnitude:
             st.detrend('demean')
             st.detrend('linear')
             detrend_list.extend([max(st[0].data), abs(min(st[0].data))])
+        return self._threshold_code(
+            station, comp, max(raw_list), max(detrend_list)
+        )
+
+    @staticmethod
+    def _threshold_code(
+        station: str, comp: str, max_amp: float, max_detrend_amp: float
+    ) -> int:
+        """
+        Code 0 drops the station, code 1 uses the plain Wood-Anderson amplitude and
+        code 2 bandpasses it first.
+        """
         seis_type = comp[1]
-        max_amp = max(raw_list)
-        max_detrend_amp = max(detrend_list)
         if seis_type == 'L':
             if max_amp <= 0.1:
                 logging.info(
@@ -478,6 +627,106 @@ class Magnitude:
 
         return nloga - dA
 
+    def _load_amplitudes(self) -> dict:
+        """
+        Load the picks with stored amplitudes, grouped by the 4-char station name
+        and phase type and sorted by time.
+        """
+        df = read_picks(
+            self.pick_amplitudes,
+            columns=['station_id', 'phase_time', 'phase_type', *amplitude_columns],
+        )
+        station_id = df['station_id'].astype(str)
+        df['station'] = np.where(
+            station_id.str.contains('.', regex=False),
+            station_id.str.split('.').str[1],
+            station_id,
+        )
+        df['phase_time'] = pd.to_datetime(df['phase_time'])
+        df['pair_time'] = pd.to_datetime(df['pair_time'])
+        df = df.dropna(subset=['instrument']).sort_values('phase_time')
+        return {
+            key: group.reset_index(drop=True)
+            for key, group in df.groupby(['station', 'phase_type'])
+        }
+
+    def _stored_window(self, df_sta_picks: pd.DataFrame) -> tuple[str, str]:
+        """
+        Phase and column suffix of the stored ``_calculate_time_window`` window.
+        """
+        phases = dict(zip(df_sta_picks['phase_type'], df_sta_picks['phase_time']))
+        if len(df_sta_picks) == 2:
+            sp = (
+                pd.Timestamp(phases['S']) - pd.Timestamp(phases['P'])
+            ).total_seconds()
+            if sp * 2 + 5 >= 80:
+                return ('P', '80')
+            return ('P', 'pair')
+        if 'P' in phases:
+            dist = float(df_sta_picks['dist'].iloc[0])
+            if dist > 250:
+                return ('P', '80')
+            if dist > 100:
+                return ('P', '40')
+            return ('P', '20')
+        return ('S', '30')
+
+    @staticmethod
+    def _nearest(times: pd.Series, time: pd.Timestamp, tolerance: float) -> int | None:
+        """Position of the sorted time nearest to time within tolerance s."""
+        i = times.searchsorted(time)
+        nearest = [k for k in (i - 1, i) if 0 <= k < len(times)]
+        if not nearest:
+            return None
+        k = min(nearest, key=lambda k: abs(times.iloc[k] - time))
+        if abs(times.iloc[k] - time) > pd.Timedelta(seconds=tolerance):
+            return None
+        return k
+
+    def _stored_response(
+        self, df_sta_picks: pd.DataFrame, station: str, mn=1000, tolerance=0.5
+    ) -> tuple[int, dict] | None:
+        """
+        Threshold code and Wood-Anderson amplitudes from the picker output.
+
+        A P-S pair under 37.5 s uses the ``pair`` window stored for the same S
+        pick. None means the waveforms have to be read, e.g. no stored amplitude
+        or the picker paired the P pick with another S pick.
+        """
+        if self.amplitudes is None:
+            return None
+        phase, suffix = self._stored_window(df_sta_picks)
+        df = self.amplitudes.get((station, phase))
+        if df is None:
+            return None
+        times = df_sta_picks.set_index('phase_type')['phase_time']
+        k = self._nearest(df['phase_time'], pd.Timestamp(times[phase]), tolerance)
+        if k is None:
+            return None
+        row = df.iloc[k]
+        if suffix == 'pair':
+            pair_time = row['pair_time']
+            if pd.isna(pair_time) or abs(
+                pair_time - pd.Timestamp(times['S'])
+            ) > pd.Timedelta(seconds=tolerance):
+                return None
+        if pd.isna(row[[f'amp_{suffix}', f'amp_detrend_{suffix}']]).any():
+            return None
+        comp = str(row['instrument'])
+        code = self._threshold_code(
+            station, comp, row[f'amp_{suffix}'], row[f'amp_detrend_{suffix}']
+        )
+        if code == 0:
+            return code, {}
+        name = 'wa_amp' if code == 1 else 'wa_bp_amp'
+        columns = [f'{name}_e_{suffix}', f'{name}_n_{suffix}']
+        if pd.isna(row[columns]).any():
+            return None
+        response_dict = {0: row[columns[0]], 1: row[columns[1]]}
+        if comp[1] == 'L' or comp[1] == 'H':
+            response_dict = {k: v * mn for k, v in response_dict.items()}
+        return code, response_dict
+
     def get_mag(self, event_index: int, use_das=False):
         """
         Calculate suitable time window for each station in N4 determination.
@@ -500,6 +749,22 @@ class Magnitude:
                 continue
             df_sta_picks = df_picks[df_picks['station_id'] == station].copy()
 
+            stored = self._stored_response(df_sta_picks, station)
+            if stored is not None:
+                code, response_dict = stored
+                if code == 0:
+                    code_error_set.add(station)
+                    continue
+                sta_mag = self._calculate_mag(
+                    response_dict=response_dict,
+                    dist=float(df_sta_picks['dist'].iloc[0]),
+                    depth=depth + df_sta_picks['elevation'].iloc[0],
+                )
+                station_num += 1
+                df_picks.loc[df_picks['station_id'] == station, 'magnitude'] = sta_mag
+                sum_mag += sta_mag
+                continue
+
             t1, t2, tt1, tt2 = self._calculate_time_window(df_sta_picks)
             # TODO: check that all time is in the same day.
             ymd, comp_list = self._check_ymd_comp(df=df_sta_picks, station=station)
@@ -562,6 +827,8 @@ class Magnitude:
         self.df_h3dd_events, self.df_h3dd_picks = self.process_h3dd(
             dout_file=self.dout_file, station_info=self.station_info
         )
+        if self.pick_amplitudes is not None:
+            self.amplitudes = self._load_amplitudes()
 
         event_indices = set(self.df_h3dd_events['h3dd_event_index'])
         partial_func = partial(self.get_mag, use_das=use_das)
@@ -1,18 +1,29 @@
 from __future__ import annotations
 
 import argparse
+import atexit
+import io
+import json
 import logging
 import multiprocessing
 import os
-from contextlib import nullcontext
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timedelta
+from glob import glob
 from pathlib import Path
 
 import matplotlib
+import numpy as np
 import pandas as pd
 import torch
 import torch.multiprocessing as mp
 import torch.utils.data
+from obspy import Stream, UTCDateTime, read
 from tqdm import tqdm
 
 from .EQNet import utils
@@ -29,12 +40,452 @@ from .EQNet.eqnet.utils import (
     plot_phasenet,
     plot_phasenet_plus,
 )
+from .pickstore import PickIndex, PickStore, index_dir, read_picks
+from .registry import ModelRegistry, model_urls
 
 # mp.set_start_method("spawn", force=True)
 log_dir = Path(__file__).parents[1].resolve() / 'log'
 matplotlib.use('agg')
 logger = logging.getLogger()
 
+# Models loaded inside a worker process, keyed by ``_model_key``, so that every
+# task handled by the same process reuses the weights instead of rebuilding them.
+_model_cache: dict = {}
+# ONNX Runtime sessions of a worker process, keyed by the .onnx path.
+_session_cache: dict = {}
+# Opset of the ONNX exports, part of their file name.
+_ONNX_OPSET = 17
+# Samples seen and samples sent to the model by the triggered inference of the
+# current task, reset in ``predict``.
+_trigger_counts: dict = defaultdict(int)
+# Thread plan of this worker process, set by ``init_worker``.
+_worker_plan: dict = {}
+# DAS patch pool of this worker process, keyed by patch_workers.
+_patch_pool_cache: dict = {}
+
+
+class _StageTimer:
+    """Accumulate wall time spent in named stages of the picking workflow."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+
+    def mark(self):
+        self._last = time.perf_counter()
+
+    def lap(self, name: str):
+        """Add the time since the last mark or lap to ``name``."""
+        now = time.perf_counter()
+        self.totals[name] += now - self._last
+        self._last = now
+
+    def report(self) -> str:
+        return ', '.join(f'{k}: {v:.2f} s' for k, v in self.totals.items())
+
+
+def _trigger_segments(
+    data: torch.Tensor,
+    nsta: int,
+    nlta: int,
+    threshold: float,
+    npad: int,
+    multiple=1024,
+) -> list:
+    """Time windows of [batch, nch, nt, nx] data around STA/LTA triggers.
+
+    The energy of all components is screened with trailing STA/LTA windows built
+    from a cumulative sum. A trigger on any trace of the batch opens a window of
+    ``npad`` samples on both sides; close windows are merged and their length is
+    rounded up to ``multiple`` samples for the U-Net.
+    """
+    nt = data.shape[-2]
+    if nt <= nlta:
+        return [(0, nt)]
+    energy = data.float().pow(2).sum(1).transpose(1, 2).reshape(-1, nt)
+    cumsum = torch.nn.functional.pad(torch.cumsum(energy, dim=1), (1, 0))
+    sta = (cumsum[:, nsta:] - cumsum[:, :-nsta]) / nsta
+    lta = (cumsum[:, nlta:] - cumsum[:, :-nlta]) / nlta
+    # align both windows on their last sample
+    ratio = sta[:, nlta - nsta :] / lta.clamp_min(torch.finfo(lta.dtype).tiny)
+    hits = np.flatnonzero((ratio >= threshold).any(0).cpu().numpy()) + nlta - 1
+    if len(hits) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(hits) > 2 * npad)
+    starts = np.maximum(hits[np.r_[0, breaks + 1]] - npad, 0)
+    ends = np.minimum(hits[np.r_[breaks, -1]] + npad + 1, nt)
+    segments = []
+    for start, end in zip(starts, ends):
+        end = min(nt, start + -(-(end - start) // multiple) * multiple)
+        start = max(0, min(start, end - multiple))
+        if segments and start <= segments[-1][1]:
+            segments[-1] = (segments[-1][0], end)
+        else:
+            segments.append((int(start), int(end)))
+    return segments
+
+
+def _pad_collate(samples: list) -> dict:
+    """Zero-pad the time axis of every sample to the longest one and collate.
+
+    ``nt``/``nx`` become the padded size for ``postprocess`` while ``valid_nt``
+    keeps the length of each trace, so picks in the padding can be dropped.
+    """
+    max_nt = max(sample['data'].shape[-2] for sample in samples)
+    max_nx = max(sample['data'].shape[-1] for sample in samples)
+    valid_nt = []
+    padded = []
+    for sample in samples:
+        sample = dict(sample)
+        data = torch.as_tensor(sample['data'])
+        valid_nt.append(data.shape[-2])
+        sample['data'] = torch.nn.functional.pad(
+            data, (0, max_nx - data.shape[-1], 0, max_nt - data.shape[-2])
+        )
+        sample.pop('nt', None)
+        sample.pop('nx', None)
+        padded.append(sample)
+    meta = torch.utils.data.default_collate(padded)
+    meta['nt'], meta['nx'] = max_nt, max_nx
+    meta['valid_nt'] = torch.tensor(valid_nt)
+    return meta
+
+
+def _dynamic_batches(samples, budget_bytes: float, factor: float):
+    """Group single station samples into padded batches under a memory budget.
+
+    A batch costs its padded float32 input times ``factor``, the bytes a forward
+    pass keeps alive per input byte.
+    """
+    batch = []
+    max_size = 0
+    for sample in samples:
+        size = sample['data'].numel()
+        new_max = max(max_size, size)
+        cost = (len(batch) + 1) * new_max * 4 * factor
+        if batch and cost > budget_bytes:
+            yield _pad_collate(batch)
+            batch, new_max = [], size
+        batch.append(sample)
+        max_size = new_max
+    if batch:
+        yield _pad_collate(batch)
+
+
+class _Prefetcher:
+    """Read the next batches of an iterable in a background thread.
+
+    The reader thread keeps up to ``depth`` batches in a queue while the model
+    runs on the current one. ``stall`` is the time the consumer waited for data
+    (I/O bound) and ``producer_wait`` the time the reader waited for free queue
+    slots (compute bound).
+    """
+
+    _done = object()
+
+    def __init__(self, iterable, depth: int):
+        self.iterable = iterable
+        self.queue = queue.Queue(maxsize=depth)
+        self.stats = {'batches': 0, 'stall': 0.0, 'producer_wait': 0.0, 'depth': 0}
+        self.thread = threading.Thread(target=self._produce, daemon=True)
+        self.thread.start()
+
+    def _produce(self):
+        try:
+            for item in self.iterable:
+                start = time.perf_counter()
+                self.queue.put(item)
+                self.stats['producer_wait'] += time.perf_counter() - start
+        except Exception as e:  # raised again in the consumer
+            self.queue.put(e)
+        self.queue.put(self._done)
+
+    def __iter__(self):
+        while True:
+            self.stats['depth'] += self.queue.qsize()
+            start = time.perf_counter()
+            item = self.queue.get()
+            self.stats['stall'] += time.perf_counter() - start
+            if item is self._done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            self.stats['batches'] += 1
+            yield item
+        self.thread.join()
+        self.report()
+
+    def report(self):
+        stats = self.stats
+        mean_depth = stats['depth'] / max(1, stats['batches'] + 1)
+        bound = 'I/O' if stats['stall'] > stats['producer_wait'] else 'compute'
+        logging.info(
+            f'Prefetch (pid {os.getpid()}): {stats["batches"]} batches, mean queue '
+            f'depth {mean_depth:.1f}, stall {stats["stall"]:.2f} s, producer wait '
+            f'{stats["producer_wait"]:.2f} s ({bound} bound)'
+        )
+
+
+class _Broadcast:
+    """Read an iterable once and hand every item to several consumers.
+
+    Each consumer iterates its own view, backed by a queue of ``depth`` items, and
+    gets a shallow copy of every dict item, so ``postprocess`` of one model does
+    not change the batch seen by another. A view that stops early is skipped.
+    """
+
+    _done = object()
+
+    class _View:
+        def __init__(self, length, depth: int):
+            self.queue = queue.Queue(maxsize=depth)
+            self.length = length
+            self.closed = False
+
+        def __len__(self):
+            return self.length
+
+        def __iter__(self):
+            while True:
+                item = self.queue.get()
+                if item is _Broadcast._done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+
+    def __init__(self, iterable, n: int, depth=2):
+        self.iterable = iterable
+        length = len(iterable) if hasattr(iterable, '__len__') else None
+        self.views = [self._View(length, depth) for _ in range(n)]
+        self.thread = threading.Thread(target=self._produce, daemon=True)
+        self.thread.start()
+
+    def _put(self, view, item):
+        while not view.closed:
+            try:
+                view.queue.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def _produce(self):
+        try:
+            for item in self.iterable:
+                for view in self.views:
+                    self._put(view, dict(item) if isinstance(item, dict) else item)
+        except Exception as e:  # raised again in every consumer
+            for view in self.views:
+                self._put(view, e)
+        for view in self.views:
+            self._put(view, self._done)
+
+
+def _drop_padded_picks(picks: list, meta: dict) -> list:
+    """Remove picks that fall in the zero padding added by ``_pad_collate``."""
+    if 'valid_nt' not in meta:
+        return picks
+    return [
+        [pick for pick in picks_ if pick['phase_index'] < int(valid_nt)]
+        for picks_, valid_nt in zip(picks, meta['valid_nt'])
+    ]
+
+
+class _PhaseHead(torch.nn.Module):
+    """Tensor in, tensor out view of an EQNet model, used for the ONNX export."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, data):
+        return self.model({'data': data})['phase']
+
+
+class _OnnxModel:
+    """Run an exported PhaseNet graph with ONNX Runtime like the torch model.
+
+    onnxruntime is only imported here, users of the torch engine do not need it.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    @classmethod
+    def load(cls, onnx_path: str, threads: int | None = None) -> _OnnxModel:
+        import onnxruntime as ort
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        if threads is not None:
+            session_options.intra_op_num_threads = threads
+        return cls(
+            ort.InferenceSession(
+                onnx_path,
+                sess_options=session_options,
+                providers=['CPUExecutionProvider'],
+            )
+        )
+
+    def eval(self):
+        return self
+
+    def __call__(self, meta):
+        data = meta['data'].numpy().astype('float32', copy=False)
+        (phase,) = self.session.run(['phase'], {'data': data})
+        return {'phase': torch.from_numpy(phase)}
+
+
+# PhaseNet of a DAS patch worker, set by ``_init_patch_worker``.
+_patch_picker: dict = {}
+
+
+def _init_patch_worker(picker, plan: dict, counter):
+    """Keep the picker in the patch worker and load its model once."""
+    _patch_picker['picker'] = picker
+    picker.init_worker(plan, counter)
+
+
+def _das_patch_picks(args, meta) -> tuple:
+    """Pick one DAS batch in a patch worker, with the model of the process."""
+    picker = _patch_picker['picker']
+    if args.engine == 'onnx':
+        model = picker._get_session(args)
+    else:
+        model = picker._get_model(args, torch.device(args.device)).eval()
+    before = dict(_trigger_counts)
+    with torch.inference_mode():
+        meta, scores, picks_, plot_picks = picker._das_picks(args, model, meta)
+    counts = {k: v - before.get(k, 0) for k, v in _trigger_counts.items()}
+    if not args.plot_figure:  # only the figures need the data and scores
+        meta = {k: v for k, v in meta.items() if k != 'data'}
+        scores = None
+    return meta, scores, picks_, plot_picks, counts
+
+
+def das_station_id(channel_index: pd.Series) -> pd.Series:
+    """Convert DAS channel indices into the A####/B#### station names."""
+    station_id = channel_index.astype(int).astype(str).str.zfill(4)
+    prefix = pd.Series(
+        np.where(station_id.str[0] == '0', 'A', 'B'), index=station_id.index
+    )
+    return prefix + station_id.str[1:]
+
+
+def _reduce_channels(data: torch.Tensor, spacing: int, mode: str) -> torch.Tensor:
+    """Keep every spacing-th DAS channel of [..., nx] data, or stack each group of
+    spacing neighbouring channels into one re-normalized virtual channel."""
+    if mode == 'decimate':
+        return data[..., ::spacing]
+    nx = data.shape[-1] // spacing * spacing
+    stacked = data[..., :nx].unflatten(-1, (-1, spacing)).mean(-1)
+    std = stacked.std(dim=-2, keepdim=True)
+    return stacked / torch.where(std > 0, std, torch.ones_like(std))
+
+
+def _remap_channels(picks: list, begin_channel_index, spacing: int, offset: int):
+    """Map the picks on reduced channels back to the original channel indices."""
+    remapped = []
+    for i, picks_ in enumerate(picks):
+        begin = 0 if begin_channel_index is None else int(begin_channel_index[i])
+        remapped.append(
+            [
+                {
+                    **pick,
+                    'station_id': str(
+                        begin + int(pick['station_id']) * spacing + offset
+                    ),
+                }
+                for pick in picks_
+            ]
+        )
+    return remapped
+
+
+def _to_cpu(obj):
+    """Copy the tensors in obj to CPU, so that the copy can outlive the batch."""
+    if torch.is_tensor(obj):
+        obj = obj.detach().cpu()
+        return obj.float() if obj.is_floating_point() else obj.clone()
+    if isinstance(obj, dict):
+        return {k: _to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(x) for x in obj)
+    return obj
+
+
+# FigureRenderer of this process, keyed by (plot_workers, plot_backlog).
+_renderer_cache: dict = {}
+
+
+class FigureRenderer:
+    """## Render PhaseNet figures in a separate process pool.
+
+    ``submit`` copies the inputs to CPU and hands them to the pool, and blocks once
+    ``max_backlog`` figures are waiting, so a slow renderer can not fill the memory.
+    The pool uses spawned processes, which do not inherit the torch thread pools
+    of the picker. ``open`` keeps one renderer per worker process for all of its
+    tasks, so the pool and its torch import are only started once.
+    """
+
+    def __init__(self, max_workers=2, max_backlog=8):
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')
+        )
+        self.backlog = threading.BoundedSemaphore(max_backlog)
+        self.futures = []
+
+    @classmethod
+    def open(cls, args) -> FigureRenderer | None:
+        if not args.plot_figure:
+            return None
+        key = (args.plot_workers, args.plot_backlog)
+        if key not in _renderer_cache:
+            renderer = cls(max_workers=args.plot_workers, max_backlog=args.plot_backlog)
+            atexit.register(renderer.shutdown)
+            _renderer_cache[key] = renderer
+        return _renderer_cache[key]
+
+    def _done(self, future):
+        self.backlog.release()
+        if future.exception() is not None:
+            logging.warning(f'Figure rendering failed: {future.exception()}')
+
+    def submit(self, plot_func, *args, **kwargs):
+        self.backlog.acquire()
+        future = self.executor.submit(plot_func, *_to_cpu(args), **_to_cpu(kwargs))
+        future.add_done_callback(self._done)
+        self.futures.append(future)
+
+    def drain(self):
+        """## Wait for the figures submitted so far, the pool stays for later tasks."""
+        futures, self.futures = self.futures, []
+        wait(futures)
+
+    def shutdown(self):
+        """## Wait for the waiting figures and stop the pool."""
+        self.executor.shutdown(wait=True)
+
+
+def _model_key(args) -> tuple:
+    return (
+        args.model,
+        args.backbone,
+        tuple(args.phases),
+        args.resume,
+        args.location,
+        args.device,
+    )
+
 
 class PhaseNet:
     def __init__(
@@ -75,7 +526,32 @@ class PhaseNet:
         resample_space=False,  # DAS
         system: str | None = None,  # DAS
         location: str | None = None,  # DAS
-        skip_existing=False,  # DAS
+        skip_existing=False,
+        files_per_task: int | None = None,
+        batch_memory_mb: float | None = None,
+        batch_memory_factor=64.0,
+        engine='torch',
+        cpu_precision='fp32',
+        pick_store=False,
+        plot_workers=2,
+        plot_backlog=8,
+        model_dir: Path | None = None,
+        day_overlap=0.0,
+        dedup_tolerance=0.5,
+        patch_workers: int | None = None,
+        das_channel_spacing=1,
+        das_channel_mode='decimate',
+        trigger=False,
+        trigger_sta=1.0,
+        trigger_lta=30.0,
+        trigger_threshold=3.0,
+        trigger_pad=30.0,
+        torch_threads: int | None = None,
+        pin_workers=False,
+        prefetch_batches=0,
+        pick_amplitude=False,
+        pz_dir: Path | None = None,
+        extra_models: list | None = None,
     ):
         """## A class for running EQNet model using pythonic interface.
 
@@ -94,6 +570,7 @@ class PhaseNet:
             - dataset (str, optional): Dataset to use. Defaults to 'das'.
             - model (str, optional): Model to use. Defaults to 'phasenet_das'.
             - resume (str, optional): Path to the checkpoint file. Defaults to ''.
+            - model_dir (Path | None, optional): Directory of the model registry holding the pretrained weights. If None, $AUTOQUAKE_MODEL_DIR or model_registry in the repo is used. Defaults to None.
             - backbone (str, optional): Backbone to use. Defaults to 'unet'.
             - phases (list, optional): Phases to detect. Defaults to ['P', 'S'].
             - device (str, optional): Device to use. Defaults to 'cuda'.
@@ -104,21 +581,45 @@ class PhaseNet:
             - world_size (int, optional): Number of GPUs to use. Defaults to 1.
             - dist_url (str, optional): URL used to set up distributed training. Defaults to 'env://'.
             - plot_figure (bool, optional): Whether to plot the figure. Defaults to False.
+            - plot_workers (int, optional): Number of processes that render the figures next to each picking worker. Defaults to 2.
+            - plot_backlog (int, optional): Max number of figures waiting for rendering before inference waits. Defaults to 8.
             - min_prob (float, optional): Minimum probability to use. Defaults to 0.3.
             - add_polarity (bool, optional): Whether to add polarity. Defaults to False.
             - add_event (bool, optional): Whether to use event information. Defaults to True.
             - sampling_rate (float, optional): Sampling rate. Defaults to 100.0.
             - highpass_filter (float | None, optional): Highpass filter. If None, no highpass filter will be used. Defaults to None (give 0.0 if use phasenet_das).
             - response_path (str | None, optional): Path to the response file. If None, no response will be used. Defaults to None.
+            - day_overlap (float, optional): Seconds read from both sides of every midnight between two days of the range. The seam windows are picked once more and the duplicated picks are removed when concatenating (seismometer data). Defaults to 0.0.
+            - dedup_tolerance (float, optional): Picks of the same station and phase closer than this (s) are duplicates, the one with the highest score is kept. Only used with day_overlap. Defaults to 0.5.
             - subdir_level (int, optional): Number of subdirectories to use. Defaults to 0.
             - cut_patch (bool, optional): Whether to cut patch. Defaults to False.
             - nt (int, optional): Number of time samples. Defaults to 1024 * 20.
             - nx (int, optional): Number of spatial samples. Defaults to 1024 * 5.
+            - patch_workers (int | None, optional): DAS only. Number of processes of a worker that pick its DAS batches in parallel, e.g. the nt x nx patches of one hdf5 file with cut_patch. The picks are written in input order. The pool is kept for all the tasks of the worker and shares its torch threads and cores, so run_predict(processes) starts processes x patch_workers patch processes in total; use processes=1 to give one worker all the cores. If None, the batches are picked in the worker. Defaults to None.
+            - das_channel_spacing (int, optional): DAS only. Pick on one channel out of every das_channel_spacing channels, which cuts the picks sent to association. Defaults to 1.
+            - das_channel_mode (str, optional): 'decimate' picks on the first channel of each group, 'stack' picks on the mean of the group and reports the picks on its center channel. Defaults to 'decimate'.
+            - trigger (bool, optional): phasenet and phasenet_das only. Screen each batch with an STA/LTA detector and run the model only on the windows around the triggers, the rest is treated as noise. Check the recall with evaluate_trigger before a large run. Defaults to False.
+            - trigger_sta (float, optional): STA window (s). Defaults to 1.0.
+            - trigger_lta (float, optional): LTA window (s). Defaults to 30.0.
+            - trigger_threshold (float, optional): STA/LTA ratio that opens a window. Defaults to 3.0.
+            - trigger_pad (float, optional): Data (s) kept on both sides of a trigger, it should cover the S arrival and the receptive field of the model. Defaults to 30.0.
+            - torch_threads (int | None, optional): Intra-op threads of every run_predict worker. If None, the available cores are shared between the workers and their data loader workers. Defaults to None.
+            - pin_workers (bool, optional): Whether to pin every run_predict worker to its own set of cores. Defaults to False.
+            - prefetch_batches (int, optional): Number of batches read and preprocessed in a background thread while the model runs. 0 reads in the inference thread. Defaults to 0.
+            - pick_amplitude (bool, optional): Seismometer only. Whether to add the raw and detrended peak E/N amplitudes in the Magnitude windows of every pick (amp_{length}, amp_detrend_{length}, and amp_pair, amp_detrend_pair for a P pick with an S pick within 37.5 s) to the picks, so that Magnitude(pick_amplitudes=...) can skip the waveform reads of stations whose picks match. They are computed on a writer thread behind the forward passes. Defaults to False.
+            - pz_dir (Path | None, optional): Directory of the PZ files. If given with pick_amplitude, the Wood-Anderson simulated peaks (wa_amp_e_*, wa_amp_n_*) and their 1-25 Hz bandpassed peaks for code 2 stations (wa_bp_amp_e_*, wa_bp_amp_n_*) are added as well. Defaults to None.
+            - extra_models (list | None, optional): Seismometer only. Other models (e.g. ['phasenet_plus']) fed by the same data loading pass as model, each writes its own picks_{model}. They run with the torch engine and their default weights. Defaults to None.
             - resample_time (bool, optional): Whether to resample time. Defaults to False.
             - resample_space (bool, optional): Whether to resample space. Defaults to False.
             - system (str | None, optional): System to use. If None, no system will be used. Defaults to None.
             - location (str | None, optional): The name of systems at location. If None, no location will be used. Defaults to None.
-            - skip_existing (bool, optional): Whether to skip existing files. Defaults to False.
+            - skip_existing (bool, optional): Whether to skip existing files. For seismometer data, station files recorded as finished in the manifest of the day (same files, sizes, mtimes and model) are skipped and their pick csvs are reused. With pick_store, a task (seismometer or DAS) is skipped when all its files are in the manifest, otherwise it is picked again and replaces its store parts. Defaults to False.
+            - files_per_task (int | None, optional): Number of station files (or DAS hdf5 files) per worker task. If None, each day is a single task. Defaults to None.
+            - batch_memory_mb (float | None, optional): Memory budget of one seismometer batch. If given, traces of several stations are zero-padded to the same length and run in one forward pass as long as the estimated memory stays within the budget, replacing batch_size. Defaults to None.
+            - batch_memory_factor (float, optional): Bytes of memory a forward pass needs per byte of float32 input, which turns batch_memory_mb into a number of stations. The activations of the UNet layers and their skip connections are a few dozen times the input, raise it if batches run out of memory and lower it if they leave memory unused. Defaults to 64.0.
+            - engine (str, optional): Inference engine, 'torch' or 'onnx'. 'onnx' exports the checkpoint once (cached next to the checkpoint, keyed by its sha256, backbone and opset) and runs phasenet/phasenet_das through an ONNX Runtime CPU session. Defaults to 'torch'.
+            - cpu_precision (str, optional): Precision of the torch forward pass on CPU, 'fp32' or 'bf16'. Check the picks with compare_precision before using bf16 for a large run. Defaults to 'fp32'.
+            - pick_store (bool, optional): Whether to write the picks into a day-partitioned Parquet store (picks_{model}/store) in batches instead of one csv per input file. The concatenated picks are then saved as picks.parquet. Defaults to False.
         """
         self.data_parent_dir = data_parent_dir
         self.start_ymd = start_ymd
@@ -157,10 +658,39 @@ class PhaseNet:
         self.system = system
         self.location = location
         self.skip_existing = skip_existing
+        self.files_per_task = files_per_task
+        self.batch_memory_mb = batch_memory_mb
+        self.batch_memory_factor = batch_memory_factor
+        self.engine = self._check_engine(engine)
+        self.cpu_precision = self._check_cpu_precision(cpu_precision)
+        self.pick_store = pick_store
+        self.plot_workers = plot_workers
+        self.plot_backlog = plot_backlog
+        self.model_dir = model_dir
+        self.day_overlap = day_overlap
+        self.dedup_tolerance = dedup_tolerance
+        self.patch_workers = patch_workers
+        self.das_channel_spacing = das_channel_spacing
+        self.das_channel_mode = self._check_das_channel_mode(das_channel_mode)
+        self.trigger = self._check_trigger(trigger)
+        self.trigger_sta = trigger_sta
+        self.trigger_lta = trigger_lta
+        self.trigger_threshold = trigger_threshold
+        self.trigger_pad = trigger_pad
+        self.torch_threads = torch_threads
+        self.pin_workers = pin_workers
+        self.prefetch_batches = prefetch_batches
+        self.pick_amplitude = pick_amplitude
+        self.pz_dir = pz_dir
+        self.extra_models = self._check_extra_models(extra_models)
+        if self.engine == 'onnx' and self.device != 'cpu':
+            logging.info('onnx engine runs on CPU, device is set to cpu')
+            self.device = 'cpu'
         # Initialize instance variables based on parsed self.args
         self.input_to_args()
 
-        self.picks = self.result_path / f'picks_{model}' / self.dir_name / 'picks.csv'
+        picks_name = 'picks.parquet' if pick_store else 'picks.csv'
+        self.picks = self.result_path / f'picks_{model}' / self.dir_name / picks_name
 
     def _check_result_dir(self, result_path: Path | None) -> Path:
         """## Check whether result directory exists or not
@@ -173,6 +703,62 @@ class PhaseNet:
         else:
             return result_path
 
+    def _check_engine(self, engine: str) -> str:
+        if engine not in ['torch', 'onnx']:
+            raise ValueError(f'Unknown engine {engine}, please use torch or onnx')
+        if engine == 'onnx' and self.model == 'phasenet_plus':
+            raise ValueError('onnx engine only supports phasenet and phasenet_das')
+        return engine
+
+    def _check_cpu_precision(self, cpu_precision: str) -> str:
+        if cpu_precision not in ['fp32', 'bf16']:
+            raise ValueError(
+                f'Unknown cpu_precision {cpu_precision}, please use fp32 or bf16'
+            )
+        return cpu_precision
+
+    def _check_das_channel_mode(self, das_channel_mode: str) -> str:
+        if das_channel_mode not in ['decimate', 'stack']:
+            raise ValueError(
+                f'Unknown das_channel_mode {das_channel_mode}, please use decimate or stack'
+            )
+        return das_channel_mode
+
+    def _check_trigger(self, trigger: bool) -> bool:
+        if trigger and self.model == 'phasenet_plus':
+            raise ValueError('trigger is only supported for phasenet and phasenet_das')
+        return trigger
+
+    def _check_extra_models(self, extra_models: list | None) -> list:
+        extra_models = [m for m in extra_models or [] if m != self.model]
+        seismic = ['phasenet', 'phasenet_plus']
+        if extra_models and (
+            self.model not in seismic or any(m not in seismic for m in extra_models)
+        ):
+            raise ValueError(
+                'extra_models only shares the data of phasenet and phasenet_plus'
+            )
+        return extra_models
+
+    @staticmethod
+    def _model_args(args, model: str):
+        """## Task arguments of one of the extra_models."""
+        task = argparse.Namespace(**vars(args))
+        task.model = model
+        task.resume = ''
+        task.engine = 'torch'
+        task.extra_models = []
+        if (model, task.location) not in model_urls:
+            task.location = None
+        return task
+
+    @staticmethod
+    def _channel_offset(args) -> int:
+        """## Original channel that represents a group of reduced DAS channels."""
+        if args.das_channel_mode == 'stack':
+            return (args.das_channel_spacing - 1) // 2
+        return 0
+
     def date_range(self):
         """## Get date range from start_ymd to end_ymd
 
@@ -208,45 +794,74 @@ class PhaseNet:
         self.date_list = self.date_range()
         for date in self.date_list:
             data_path = next(self.data_parent_dir.glob(f'*{date}*'))
-            args = argparse.Namespace(
-                data_path=str(data_path),
-                data_list=self._check_data_list(self.data_list, data_path),
-                ymd=date,
-                result_path=str(self.result_path),
-                hdf5_file=self.hdf5_file,
-                prefix=self.prefix,
-                format=self.format,
-                dataset=self.dataset,
-                model=self.model,
-                resume=self.resume,
-                backbone=self.backbone,
-                phases=self.phases,
-                device=self.device,
-                workers=self.workers,
-                batch_size=self.batch_size,
-                use_deterministic_algorithms=self.use_deterministic_algorithms,
-                amp=self.amp,
-                world_size=self.world_size,
-                dist_url=self.dist_url,
-                plot_figure=self.plot_figure,
-                min_prob=self.min_prob,
-                add_polarity=self.add_polarity,
-                add_event=self.add_event,
-                sampling_rate=self.sampling_rate,
-                highpass_filter=self.highpass_filter,
-                response_path=self.response_path,
-                response_xml=self.response_xml,
-                subdir_level=self.subdir_level,
-                cut_patch=self.cut_patch,
-                nt=self.nt,
-                nx=self.nx,
-                resample_time=self.resample_time,
-                resample_space=self.resample_space,
-                system=self.system,
-                location=self.location,
-                skip_existing=self.skip_existing,
+            self.args_list.append(
+                self._build_args(
+                    data_path, self._check_data_list(self.data_list, data_path), date
+                )
             )
-            self.args_list.append(args)
+
+    def _build_args(self, data_path: Path, data_list, ymd: str) -> argparse.Namespace:
+        """## Collect the settings of one picking task into argparse.Namespace."""
+        return argparse.Namespace(
+            data_path=str(data_path),
+            data_list=data_list,
+            ymd=ymd,
+            task_id=ymd,
+            result_path=str(self.result_path),
+            hdf5_file=self.hdf5_file,
+            prefix=self.prefix,
+            format=self.format,
+            dataset=self.dataset,
+            model=self.model,
+            resume=self.resume,
+            backbone=self.backbone,
+            phases=self.phases,
+            device=self.device,
+            workers=self.workers,
+            batch_size=self.batch_size,
+            use_deterministic_algorithms=self.use_deterministic_algorithms,
+            amp=self.amp,
+            world_size=self.world_size,
+            dist_url=self.dist_url,
+            plot_figure=self.plot_figure,
+            min_prob=self.min_prob,
+            add_polarity=self.add_polarity,
+            add_event=self.add_event,
+            sampling_rate=self.sampling_rate,
+            highpass_filter=self.highpass_filter,
+            response_path=self.response_path,
+            response_xml=self.response_xml,
+            subdir_level=self.subdir_level,
+            cut_patch=self.cut_patch,
+            nt=self.nt,
+            nx=self.nx,
+            resample_time=self.resample_time,
+            resample_space=self.resample_space,
+            system=self.system,
+            location=self.location,
+            skip_existing=self.skip_existing,
+            batch_memory_mb=self.batch_memory_mb,
+            batch_memory_factor=self.batch_memory_factor,
+            engine=self.engine,
+            cpu_precision=self.cpu_precision,
+            pick_store=self.pick_store,
+            plot_workers=self.plot_workers,
+            plot_backlog=self.plot_backlog,
+            model_dir=self.model_dir,
+            patch_workers=self.patch_workers,
+            das_channel_spacing=self.das_channel_spacing,
+            das_channel_mode=self.das_channel_mode,
+            trigger=self.trigger,
+            trigger_sta=self.trigger_sta,
+            trigger_lta=self.trigger_lta,
+            trigger_threshold=self.trigger_threshold,
+            trigger_pad=self.trigger_pad,
+            prefetch_batches=self.prefetch_batches,
+            pick_amplitude=self.pick_amplitude,
+            pz_dir=self.pz_dir,
+            extra_models=self.extra_models,
+            merge_outputs=True,
+        )
 
     def _check_data_list(self, data_list, data_path: Path):
         """## Check whether data_list exists or not
@@ -269,19 +884,38 @@ class PhaseNet:
         return data_list
 
     @staticmethod
-    def concat_picks(date_list: list, result_path: Path, model: str, dir_name: str):
+    def concat_picks(
+        date_list: list,
+        result_path: Path,
+        model: str,
+        dir_name: str,
+        pick_store=False,
+        dedup_tolerance: float | None = None,
+    ):
         """## Concatenate daily picks to a single csv file.
 
         There exists 2 scenario:
             1. single day: generating picks.csv in ymd directory.
             2. multiple days: generating picks.csv in {start_ymd}_{end_ymd} directory.
 
+        With pick_store, the days are read from the Parquet store and saved as a
+        typed picks.parquet instead. With dedup_tolerance, the picks repeated by the
+        overlapping midnight windows are removed.
         """
+        date_dir = result_path / f'picks_{model}' / dir_name
+        if pick_store:
+            store = PickStore(result_path / f'picks_{model}' / 'store')
+            result = store.read(dates=[date[:8] for date in date_list])
+            if dedup_tolerance is not None:
+                result = PhaseNet.dedup_picks(result, dedup_tolerance)
+            date_dir.mkdir(parents=True, exist_ok=True)
+            result.to_parquet(date_dir / 'picks.parquet', index=False)
+            return
         concat_list = []
         for date in date_list:
             # TODO: What about DAS data?
             picks_path = result_path / f'picks_{model}'
-            if model == 'phasenet':
+            if model in ['phasenet', 'phasenet_plus']:
                 df = pd.read_csv(
                     picks_path / f'{date}.csv'
                 )  # because phasenet automatic combined the daily picks outside the dir.
@@ -295,27 +929,50 @@ class PhaseNet:
                         logging.warning(f'{csv_} is empty, skipping...')
                         continue
                     # Converting the channel_index into a string-like station name.
-                    df['station_id'] = df['channel_index'].astype(str).str.zfill(4)
-                    df['station_id'] = df['station_id'].apply(
-                        lambda x: f'A{x[1:]}' if x[0] == '0' else f'B{x[1:]}'
-                    )
+                    df['station_id'] = das_station_id(df['channel_index'])
                     concat_list.append(df)
 
         result = pd.concat(concat_list)
-        date_dir = result_path / f'picks_{model}' / dir_name
+        if dedup_tolerance is not None:
+            result = PhaseNet.dedup_picks(result, dedup_tolerance)
         date_dir.mkdir(parents=True, exist_ok=True)
         result.to_csv(
             date_dir / 'picks.csv',
             index=False,
         )
 
+    @staticmethod
+    def dedup_picks(picks: pd.DataFrame, tolerance=0.5) -> pd.DataFrame:
+        """## Keep one pick per station, phase and time cluster.
+
+        Picks of the same station_id and phase_type closer than ``tolerance`` (s)
+        to the previous one form a cluster, the pick with the highest phase_score of
+        every cluster is kept.
+        """
+        if picks.empty:
+            return picks
+        picks = picks.reset_index(drop=True)
+        phase_time = pd.to_datetime(picks['phase_time'])
+        order = picks.assign(_time=phase_time).sort_values(
+            ['station_id', 'phase_type', '_time']
+        )
+        gap = (
+            order.groupby(['station_id', 'phase_type'])['_time']
+            .diff()
+            .dt.total_seconds()
+        )
+        cluster = (gap.isna() | (gap > tolerance)).cumsum()
+        keep = order['phase_score'].groupby(cluster).idxmax()
+        logging.info(f'Removed {len(picks) - len(keep)} duplicated picks')
+        return picks.loc[keep].sort_values('phase_time').reset_index(drop=True)
+
     @staticmethod
     def picking_filter(picks: Path, filt_station: Path, output_dir: Path | None = None):
         """## filtering the picks through station list"""
         df_sta = pd.read_csv(filt_station)
         filt_sta_list = df_sta['station'].tolist()
-        df_picks = pd.read_csv(picks)
-        df_picks = df_picks[df_picks['station_id'].isin(filt_sta_list)]
+        index = PickIndex.open(picks, cache_dir=index_dir(picks))
+        df_picks = index.query(stations=filt_sta_list)
         if output_dir is None:
             output_dir = picks.parent
         df_picks.to_csv(output_dir / 'filt_picks.csv', index=False)
@@ -327,15 +984,336 @@ class PhaseNet:
         get_station=lambda x: x.split('.')[1],
         output_dir=None,
     ):
-        df_picks = pd.read_csv(picks)
+        index = PickIndex.open(picks, cache_dir=index_dir(picks))
         df_sta = pd.read_csv(station)
+        # map the distinct station_id only, not every pick
+        keep = set(df_sta['station'])
+        stations = [s for s in index.stations() if get_station(s) in keep]
+        df_picks = index.query(stations=stations)
         df_picks['station_id'] = df_picks['station_id'].map(get_station)
-        df_picks = df_picks[df_picks['station_id'].isin(df_sta['station'])]
         if output_dir is None:
             output_dir = picks.parent
         df_picks.to_csv(output_dir / 'check_picks.csv', index=False)
 
+    @staticmethod
+    def _open_store(args) -> PickStore | None:
+        """## Pick store writer of a task, without the parts of its earlier runs."""
+        if not args.pick_store:
+            return None
+        store = PickStore(
+            Path(args.result_path) / f'picks_{args.model}' / 'store',
+            name=args.task_id,
+        )
+        store.clear()
+        return store
+
+    @staticmethod
+    def _store_picks(args, store, pending, picks, file_names):
+        """## Buffer the picks of one batch in the pick store.
+
+        A task replaces all its parts when it runs again, so its files are only
+        recorded as finished in the manifest once the whole task is written.
+        """
+        pending.extend(file_names)
+        frames = [pd.DataFrame(picks_) for picks_ in picks if len(picks_) > 0]
+        if not frames:
+            return
+        df = pd.concat(frames, ignore_index=True)
+        if args.model == 'phasenet_das':
+            df['channel_index'] = df['station_id'].astype(int)
+            df['station_id'] = das_station_id(df['channel_index'])
+            df = df[
+                [
+                    'station_id',
+                    'channel_index',
+                    'phase_index',
+                    'phase_time',
+                    'phase_score',
+                    'phase_type',
+                ]
+            ]
+        store.append(df)
+
+    def _write_phase_picks(self, args, store, pending, pick_path, file_names, picks):
+        """## Write the picks of one batch to their station csvs or the pick store."""
+        self._add_amplitudes(args, file_names, picks)
+        if store is not None:
+            self._store_picks(args, store, pending, picks, file_names)
+            return
+        for file_name, picks_ in zip(file_names, picks):
+            tmp = file_name.split('/')
+            parent_dir = '/'.join(tmp[-args.subdir_level - 1 : -1])
+            filename = tmp[-1].replace('*', '').replace('?', '').replace('.mseed', '')
+            csv_dir = os.path.join(pick_path, parent_dir)
+            if not os.path.exists(csv_dir):
+                os.makedirs(csv_dir, exist_ok=True)
+            if len(picks_) == 0:
+                ## keep an empty file for the file with no picks to make it easier to track processed files
+                with open(os.path.join(csv_dir, filename + '.csv'), 'a'):
+                    pass
+                continue
+            picks_df = pd.DataFrame(picks_)
+            picks_df.sort_values(by=['phase_time'], inplace=True)
+            picks_df.to_csv(os.path.join(csv_dir, filename + '.csv'), index=False)
+        self._record_finished(args, pick_path, file_names)
+
+    @staticmethod
+    def _add_amplitudes(args, file_names: list, picks: list):
+        """## Add the peak horizontal amplitudes to the picks of every station file.
+
+        The batch holds the normalized, resampled model input only, so the raw
+        traces of a station are read once for all its picks of the day, instead of
+        once per event by Magnitude. The Wood-Anderson simulation only covers the
+        windows around the picks.
+        """
+        if not args.pick_amplitude:
+            return
+        from .magnitude import peak_amplitudes
+
+        for file_name, picks_ in zip(file_names, picks):
+            if len(picks_) == 0:
+                continue
+            pattern = file_name
+            if not os.path.isabs(pattern):
+                pattern = os.path.join(args.data_path, pattern)
+            try:
+                st = read(pattern)
+            except Exception as e:
+                logging.warning(f'No amplitudes for {file_name}: {e}')
+                continue
+            amplitudes = peak_amplitudes(
+                st,
+                [pick['phase_time'] for pick in picks_],
+                pz_dir=args.pz_dir,
+                phase_types=[pick['phase_type'] for pick in picks_],
+            )
+            for pick, row in zip(picks_, amplitudes.to_dict('records')):
+                pick.update(row)
+
+    def _iter_batches(self, args, data_loader):
+        """## Iterate the data loader, packing stations under the memory budget.
+
+        With ``prefetch_batches`` the next batches are read in a background thread.
+        """
+        if args.batch_memory_mb is None or args.model == 'phasenet_das':
+            batches, total = data_loader, len(data_loader)
+        else:
+            batches = _dynamic_batches(
+                data_loader, args.batch_memory_mb * 2**20, args.batch_memory_factor
+            )
+            total = None
+        if args.prefetch_batches:
+            batches = _Prefetcher(batches, args.prefetch_batches)
+        return tqdm(batches, desc='Predicting', total=total)
+
+    @staticmethod
+    def _autocast(args):
+        """## Autocast context of the forward pass.
+
+        GPUs use fp16/bf16 autocast, CPUs stay in fp32 unless ``cpu_precision``
+        asks for bf16.
+        """
+        if args.device in ['cpu', 'mps']:
+            if args.device == 'cpu' and args.cpu_precision == 'bf16':
+                return torch.amp.autocast(device_type='cpu', dtype=torch.bfloat16)
+            return nullcontext()
+        return torch.amp.autocast(device_type=args.device, dtype=args.ptdtype)
+
+    @staticmethod
+    def compare_picks(
+        reference: pd.DataFrame, candidate: pd.DataFrame, tolerance=0.1
+    ) -> dict:
+        """## Compare two pick tables of the same data.
+
+        Every reference pick is matched to the nearest candidate pick with the same
+        station_id and phase_type within ``tolerance`` seconds.
+
+        ### Returns:
+            - report (dict): Pick counts, recall and precision of the candidate, and
+              the time (s) and score differences of the matched picks.
+        """
+        keys = ['station_id', 'phase_type']
+        reference = reference.copy()
+        candidate = candidate.copy()
+        for df in [reference, candidate]:
+            df['phase_time'] = pd.to_datetime(df['phase_time'])
+            df.sort_values('phase_time', inplace=True)
+        candidate['candidate_time'] = candidate['phase_time']
+        matched = pd.merge_asof(
+            reference[keys + ['phase_time', 'phase_score']],
+            candidate[keys + ['phase_time', 'candidate_time', 'phase_score']],
+            on='phase_time',
+            by=keys,
+            direction='nearest',
+            tolerance=pd.Timedelta(seconds=tolerance),
+            suffixes=('', '_candidate'),
+        ).dropna(subset=['candidate_time'])
+        time_diff = (
+            (matched['candidate_time'] - matched['phase_time']).dt.total_seconds().abs()
+        )
+        score_diff = (matched['phase_score_candidate'] - matched['phase_score']).abs()
+        n_ref, n_cand, n_match = len(reference), len(candidate), len(matched)
+        return {
+            'reference_picks': n_ref,
+            'candidate_picks': n_cand,
+            'matched_picks': n_match,
+            'recall': n_match / n_ref if n_ref else float('nan'),
+            'precision': n_match / n_cand if n_cand else float('nan'),
+            'time_diff_mean_s': float(time_diff.mean()),
+            'time_diff_p95_s': float(time_diff.quantile(0.95)),
+            'time_diff_max_s': float(time_diff.max()),
+            'score_diff_mean': float(score_diff.mean()),
+        }
+
+    def _pick_dates(
+        self,
+        result_path: Path,
+        dates: list,
+        precision: str,
+        engine='torch',
+        trigger=False,
+        counts: dict | None = None,
+    ) -> pd.DataFrame:
+        """## Pick the given dates sequentially into result_path and load the picks.
+
+        The stage timings and sample counts of the tasks are added to ``counts``.
+        """
+        for args in self.args_list:
+            if args.ymd not in dates:
+                continue
+            task = argparse.Namespace(**vars(args))
+            task.result_path = str(result_path)
+            task.cpu_precision = precision
+            task.engine = engine
+            task.trigger = trigger
+            task.merge_outputs = True
+            for key, value in self.predict(task).items():
+                if counts is not None:
+                    counts[key] = counts.get(key, 0) + value
+        self.concat_picks(
+            date_list=dates,
+            result_path=result_path,
+            model=self.model,
+            dir_name='check',
+            pick_store=self.pick_store,
+        )
+        picks_name = 'picks.parquet' if self.pick_store else 'picks.csv'
+        return read_picks(result_path / f'picks_{self.model}' / 'check' / picks_name)
+
+    def compare_precision(
+        self, sample_dates: list | None = None, n_days=3, tolerance=0.1
+    ) -> dict:
+        """## Compare cpu_precision against fp32 on a sample of days.
+
+        ### Args:
+            - sample_dates (list | None, optional): Dates (YYYYMMDD) to compare. If None, n_days dates spread over the range are used. Defaults to None.
+            - n_days (int, optional): Number of sampled days. Defaults to 3.
+            - tolerance (float, optional): Max time difference (s) of matched picks. Defaults to 0.1.
+        """
+        if self.cpu_precision == 'fp32':
+            raise ValueError('cpu_precision is fp32, nothing to compare')
+        if sample_dates is None:
+            step = max(1, len(self.date_list) // n_days)
+            sample_dates = self.date_list[::step][:n_days]
+        check_dir = self.result_path / 'precision_check'
+        self._prepare_models()
+        reference = self._pick_dates(check_dir / 'fp32', sample_dates, 'fp32')
+        candidate = self._pick_dates(
+            check_dir / self.cpu_precision, sample_dates, self.cpu_precision
+        )
+        report = self.compare_picks(reference, candidate, tolerance=tolerance)
+        report['dates'] = sample_dates
+        logging.info(f'{self.cpu_precision} against fp32: {report}')
+        with open(check_dir / 'precision_report.json', 'w') as f:
+            json.dump(report, f, indent=4)
+        return report
+
+    def evaluate_trigger(
+        self, sample_dates: list | None = None, n_days=1, tolerance=0.1
+    ) -> dict:
+        """## Compare the triggered picks against a full run on a sample of days.
+
+        The recall of the report is the share of the full-run picks that the
+        triggered run keeps, use it to tune the trigger thresholds.
+
+        ### Args:
+            - sample_dates (list | None, optional): Dates (YYYYMMDD) to compare. If None, n_days dates spread over the range are used. Defaults to None.
+            - n_days (int, optional): Number of sampled days. Defaults to 1.
+            - tolerance (float, optional): Max time difference (s) of matched picks. Defaults to 0.1.
+        """
+        if sample_dates is None:
+            step = max(1, len(self.date_list) // n_days)
+            sample_dates = self.date_list[::step][:n_days]
+        check_dir = self.result_path / 'trigger_check'
+        self._prepare_models()
+        reference = self._pick_dates(
+            check_dir / 'full', sample_dates, self.cpu_precision, self.engine
+        )
+        counts = {}
+        candidate = self._pick_dates(
+            check_dir / 'triggered',
+            sample_dates,
+            self.cpu_precision,
+            self.engine,
+            trigger=True,
+            counts=counts,
+        )
+        report = self.compare_picks(reference, candidate, tolerance=tolerance)
+        report['skipped_fraction'] = self._skipped_fraction(counts)
+        report['dates'] = sample_dates
+        report['trigger'] = {
+            'sta': self.trigger_sta,
+            'lta': self.trigger_lta,
+            'threshold': self.trigger_threshold,
+            'pad': self.trigger_pad,
+        }
+        logging.info(f'triggered against full picking: {report}')
+        with open(check_dir / 'trigger_report.json', 'w') as f:
+            json.dump(report, f, indent=4)
+        return report
+
+    @staticmethod
+    def _skipped_fraction(counts: dict) -> float:
+        if not counts.get('trigger_samples'):
+            return float('nan')
+        return 1 - counts['model_samples'] / counts['trigger_samples']
+
+    def _forward(self, args, model, meta) -> dict:
+        """## Forward pass, restricted to the STA/LTA windows with ``trigger``.
+
+        Outside the windows the phase logits are set to noise, so the peak
+        detection and pick extraction run unchanged on the full time axis.
+        """
+        if not args.trigger:
+            return model(meta)
+        data = meta['data']
+        batch, _, nt, nx = data.shape
+        dt = float(meta['dt_s'][0]) if 'dt_s' in meta else 0.01
+        segments = _trigger_segments(
+            data,
+            max(1, round(args.trigger_sta / dt)),
+            max(2, round(args.trigger_lta / dt)),
+            args.trigger_threshold,
+            round(args.trigger_pad / dt),
+        )
+        phase = torch.zeros((batch, len(args.phases) + 1, nt, nx), device=data.device)
+        phase[:, 1:] = -1e4
+        for start, end in segments:
+            window = dict(meta, data=data[:, :, start:end], nt=end - start)
+            output = model(window)['phase'][:, :, : end - start]
+            phase[:, :, start:end] = output.float()
+        _trigger_counts['trigger_samples'] += batch * nt * nx
+        _trigger_counts['model_samples'] += batch * nx * sum(
+            end - start for start, end in segments
+        )
+        return {'phase': phase}
+
     def postprocess(self, meta, output, polarity_scale=1, event_scale=16):
+        # peak detection and pick extraction always run in fp32
+        output = {
+            k: v.float() if torch.is_tensor(v) and v.is_floating_point() else v
+            for k, v in output.items()
+        }
         nt, nx = meta['nt'], meta['nx']
         data = meta['data'][:, :, :nt, :nx]
         # data = moving_normalize(data)
@@ -356,68 +1334,43 @@ class PhaseNet:
             ]
         return meta, output
 
-    def pred_phasenet(self, args, model, data_loader, pick_path, figure_path):
+    def pred_phasenet(
+        self, args, model, data_loader, pick_path, figure_path, timer=None
+    ):
         model.eval()
-        ctx = (
-            nullcontext()
-            if args.device == 'cpu'
-            else torch.amp.autocast(device_type=args.device, dtype=args.ptdtype)
-        )
+        timer = timer or _StageTimer()
+        timer.mark()
+        store, pending = self._open_store(args), []
+        renderer = FigureRenderer.open(args)
+        # amplitudes read the raw traces, so they are written behind the forward passes
+        writer = ThreadPoolExecutor(max_workers=1) if args.pick_amplitude else None
+        writes = []
+        ctx = self._autocast(args)
         with torch.inference_mode():
-            for meta in tqdm(data_loader, desc='Predicting', total=len(data_loader)):
+            for meta in self._iter_batches(args, data_loader):
+                timer.lap('data')
                 with ctx:
-                    output = model(meta)
+                    output = self._forward(args, model, meta)
                     meta, output = self.postprocess(meta, output)
+                timer.lap('forward')
                 if 'phase' in output:
-                    phase_scores = torch.softmax(
-                        output['phase'], dim=1
-                    )  # [batch, nch, nt, nsta]
-                    topk_phase_scores, topk_phase_inds = detect_peaks(
-                        phase_scores, vmin=args.min_prob, kernel=128
-                    )
-                    phase_picks_ = extract_picks(
-                        topk_phase_inds,
-                        topk_phase_scores,
-                        file_name=meta['file_name'],
-                        station_id=meta['station_id'],
-                        begin_time=meta['begin_time'] if 'begin_time' in meta else None,
-                        begin_time_index=meta['begin_time_index']
-                        if 'begin_time_index' in meta
-                        else None,
-                        dt=meta['dt_s'] if 'dt_s' in meta else 0.01,
-                        vmin=args.min_prob,
-                        phases=args.phases,
-                        waveform=meta['data'],
-                        window_amp=[10, 5],  # s
-                    )
-
-                for i in range(len(meta['file_name'])):
-                    tmp = meta['file_name'][i].split('/')
-                    parent_dir = '/'.join(tmp[-args.subdir_level - 1 : -1])
-                    filename = (
-                        tmp[-1].replace('*', '').replace('?', '').replace('.mseed', '')
-                    )
+                    phase_scores, phase_picks_ = self._phase_picks(args, meta, output)
 
-                    if not os.path.exists(os.path.join(pick_path, parent_dir)):
-                        os.makedirs(os.path.join(pick_path, parent_dir), exist_ok=True)
-                    if len(phase_picks_[i]) == 0:
-                        ## keep an empty file for the file with no picks to make it easier to track processed files
-                        with open(
-                            os.path.join(pick_path, parent_dir, filename + '.csv'), 'a'
-                        ):
-                            pass
-                        continue
-                    picks_df = pd.DataFrame(phase_picks_[i])
-                    picks_df.sort_values(by=['phase_time'], inplace=True)
-                    picks_df.to_csv(
-                        os.path.join(pick_path, parent_dir, filename + '.csv'),
-                        index=False,
-                    )
+                timer.lap('postprocess')
+                write_args = (
+                    args, store, pending, pick_path, meta['file_name'], phase_picks_
+                )
+                if writer is None:
+                    self._write_phase_picks(*write_args)
+                else:
+                    writes.append(writer.submit(self._write_phase_picks, *write_args))
 
+                timer.lap('write')
                 if args.plot_figure:
                     # meta["waveform_raw"] = meta["waveform"].clone()
                     # meta["data"] = moving_normalize(meta["data"])
-                    plot_phasenet(
+                    renderer.submit(
+                        plot_phasenet,
                         meta,
                         phase_scores.cpu(),
                         file_name=meta['file_name'],
@@ -425,29 +1378,71 @@ class PhaseNet:
                         figure_dir=figure_path,
                     )
 
+        if renderer is not None:
+            renderer.drain()
+        if writer is not None:
+            writer.shutdown(wait=True)
+            for future in writes:
+                future.result()
+            timer.lap('write')
+
+        if store is not None:
+            store.flush()
+            self._record_finished(args, pick_path, list(dict.fromkeys(pending)))
+            return 0
+
         ## merge picks
         if args.distributed:
             torch.distributed.barrier()
             if utils.is_main_process():
                 merge_picks(pick_path)
-        else:
+        elif args.merge_outputs:
             merge_picks(pick_path)
         return 0
 
+    @staticmethod
+    def _phase_picks(args, meta, output):
+        """## Phase scores and picks of a PhaseNet batch, for batch and stream runs."""
+        phase_scores = torch.softmax(output['phase'], dim=1)  # [batch, nch, nt, nsta]
+        topk_phase_scores, topk_phase_inds = detect_peaks(
+            phase_scores, vmin=args.min_prob, kernel=128
+        )
+        phase_picks = extract_picks(
+            topk_phase_inds,
+            topk_phase_scores,
+            file_name=meta['file_name'],
+            station_id=meta['station_id'],
+            begin_time=meta['begin_time'] if 'begin_time' in meta else None,
+            begin_time_index=meta['begin_time_index']
+            if 'begin_time_index' in meta
+            else None,
+            dt=meta['dt_s'] if 'dt_s' in meta else 0.01,
+            vmin=args.min_prob,
+            phases=args.phases,
+            waveform=meta['data'],
+            window_amp=[10, 5],  # s
+        )
+        return phase_scores, _drop_padded_picks(phase_picks, meta)
+
     def pred_phasenet_plus(
-        self, args, model, data_loader, pick_path, event_path, figure_path
+        self, args, model, data_loader, pick_path, event_path, figure_path, timer=None
     ):
         model.eval()
-        ctx = (
-            nullcontext()
-            if args.device in ['cpu', 'mps']
-            else torch.amp.autocast(device_type=args.device, dtype=args.ptdtype)
-        )
+        timer = timer or _StageTimer()
+        timer.mark()
+        store, pending = self._open_store(args), []
+        renderer = FigureRenderer.open(args)
+        # amplitudes read the raw traces, so they are written behind the forward passes
+        writer = ThreadPoolExecutor(max_workers=1) if args.pick_amplitude else None
+        writes = []
+        ctx = self._autocast(args)
         with torch.inference_mode():
-            for meta in tqdm(data_loader, desc='Predicting', total=len(data_loader)):
+            for meta in self._iter_batches(args, data_loader):
+                timer.lap('data')
                 with ctx:
                     output = model(meta)
                     meta, output = self.postprocess(meta, output)
+                timer.lap('forward')
 
                 dt = (
                     meta['dt_s']
@@ -484,6 +1479,7 @@ class PhaseNet:
                         waveform=meta['data'],
                         window_amp=[10, 5],  # s
                     )
+                    phase_picks = _drop_padded_picks(phase_picks, meta)
 
                 if ('event_center' in output) and (output['event_center'] is not None):
                     event_center = torch.sigmoid(output['event_center'])
@@ -508,28 +1504,25 @@ class PhaseNet:
                         event_time=event_time,
                     )
 
+                timer.lap('postprocess')
+                write_args = (args, store, pending, pick_path, meta['file_name'])
+                if writer is None:
+                    self._write_phase_picks(*write_args, phase_picks)
+                else:
+                    # the figures get the picks of the batch while the writer adds
+                    # the amplitudes to its own copy
+                    picks_copy = [[dict(p) for p in picks_] for picks_ in phase_picks]
+                    writes.append(
+                        writer.submit(self._write_phase_picks, *write_args, picks_copy)
+                    )
                 for i in range(len(meta['file_name'])):
                     tmp = meta['file_name'][i].split('/')
                     parent_dir = '/'.join(tmp[-args.subdir_level - 1 : -1])
                     filename = (
                         tmp[-1].replace('*', '').replace('?', '').replace('.mseed', '')
                     )
-
-                    if not os.path.exists(os.path.join(pick_path, parent_dir)):
-                        os.makedirs(os.path.join(pick_path, parent_dir), exist_ok=True)
-                    if len(phase_picks[i]) == 0:
-                        ## keep an empty file for the file with no picks to make it easier to track processed files
-                        with open(
-                            os.path.join(pick_path, parent_dir, filename + '.csv'), 'a'
-                        ):
-                            pass
+                    if store is None and len(phase_picks[i]) == 0:
                         continue
-                    picks_df = pd.DataFrame(phase_picks[i])
-                    picks_df.sort_values(by=['phase_time'], inplace=True)
-                    picks_df.to_csv(
-                        os.path.join(pick_path, parent_dir, filename + '.csv'),
-                        index=False,
-                    )
 
                     if ('event_center' in output) and ('event_time' in output):
                         if not os.path.exists(os.path.join(event_path, parent_dir)):
@@ -550,8 +1543,10 @@ class PhaseNet:
                             index=False,
                         )
 
+                timer.lap('write')
                 if args.plot_figure:
-                    plot_phasenet_plus(
+                    renderer.submit(
+                        plot_phasenet_plus,
                         meta,
                         phase_scores.cpu().float(),
                         polarity_scores.cpu().float()
@@ -568,110 +1563,238 @@ class PhaseNet:
                         figure_dir=figure_path,
                     )
 
+        if renderer is not None:
+            renderer.drain()
+        if writer is not None:
+            writer.shutdown(wait=True)
+            for future in writes:
+                future.result()
+            timer.lap('write')
+
+        if store is not None:
+            store.flush()
+            self._record_finished(args, pick_path, list(dict.fromkeys(pending)))
+
         ## merge picks
         if args.distributed:
             torch.distributed.barrier()
             if utils.is_main_process():
-                merge_picks(pick_path)
+                if store is None:
+                    merge_picks(pick_path)
                 merge_events(event_path)
-        else:
-            merge_picks(pick_path)
+        elif args.merge_outputs:
+            if store is None:
+                merge_picks(pick_path)
             merge_events(event_path)
         return 0
 
-    def pred_phasenet_das(self, args, model, data_loader, pick_path, figure_path):
-        model.eval()
-        ctx = (
-            nullcontext()
-            if args.device == 'cpu'
-            else torch.amp.autocast(device_type=args.device, dtype=args.ptdtype)
+    def _das_picks(self, args, model, meta) -> tuple:
+        """## Forward pass, peak detection and pick extraction of one DAS batch.
+
+        ### Returns:
+            - (meta, scores, picks, plot_picks): plot_picks are on the reduced
+              channels with das_channel_spacing, picks on the channels of the file.
+        """
+        reduced = args.das_channel_spacing > 1
+        begin_channel_index = meta.get('begin_channel_index')
+        if reduced:
+            meta['data'] = _reduce_channels(
+                meta['data'][..., : meta['nx']],
+                args.das_channel_spacing,
+                args.das_channel_mode,
+            )
+            meta['nx'] = meta['data'].shape[-1]
+        with self._autocast(args):
+            output = self._forward(args, model, meta)
+
+        meta, output = self.postprocess(meta, output)
+        scores = torch.softmax(output['phase'], dim=1)  # [batch, nch, nt, nsta]
+        topk_scores, topk_inds = detect_peaks(scores, vmin=args.min_prob, kernel=21)
+
+        picks_ = extract_picks(
+            topk_inds,
+            topk_scores,
+            file_name=meta['file_name'],
+            begin_time=meta['begin_time'] if 'begin_time' in meta else None,
+            begin_time_index=meta['begin_time_index']
+            if 'begin_time_index' in meta
+            else None,
+            # picks on reduced channels are mapped back below
+            begin_channel_index=None if reduced else begin_channel_index,
+            dt=meta['dt_s'] if 'dt_s' in meta else 0.01,
+            vmin=args.min_prob,
+            phases=args.phases,
         )
-        with torch.inference_mode():
-            # for meta in metric_logger.log_every(data_loader, 1, header):
-            for meta in tqdm(data_loader, desc='Predicting', total=len(data_loader)):
-                with ctx:
-                    output = model(meta)
+        plot_picks = picks_
+        if reduced:
+            picks_ = _remap_channels(
+                picks_,
+                begin_channel_index,
+                args.das_channel_spacing,
+                self._channel_offset(args),
+            )
+        return meta, scores, picks_, plot_picks
 
-                meta, output = self.postprocess(meta, output)
-                scores = torch.softmax(output['phase'], dim=1)  # [batch, nch, nt, nsta]
-                topk_scores, topk_inds = detect_peaks(
-                    scores, vmin=args.min_prob, kernel=21
-                )
+    def _patch_pool(self, args) -> ProcessPoolExecutor:
+        """## Patch pool of this worker process, started once for all its tasks.
 
-                picks_ = extract_picks(
-                    topk_inds,
-                    topk_scores,
-                    file_name=meta['file_name'],
-                    begin_time=meta['begin_time'] if 'begin_time' in meta else None,
-                    begin_time_index=meta['begin_time_index']
-                    if 'begin_time_index' in meta
-                    else None,
-                    begin_channel_index=meta['begin_channel_index']
-                    if 'begin_channel_index' in meta
-                    else None,
-                    dt=meta['dt_s'] if 'dt_s' in meta else 0.01,
-                    vmin=args.min_prob,
-                    phases=args.phases,
-                )
+        The torch threads and (with pin_workers) the cores of the worker are
+        split between the patch workers, which load the model in ``init_worker``.
+        The picker and its settings are sent once through the initializer, the
+        batches only carry args and the data.
 
-                for i in range(len(meta['file_name'])):
-                    tmp = meta['file_name'][i].split('/')
-                    parent_dir = '/'.join(tmp[-args.subdir_level - 1 : -1])
-                    filename = tmp[-1].replace('*', '').replace(f'.{args.format}', '')
-                    if not os.path.exists(os.path.join(pick_path, parent_dir)):
-                        os.makedirs(os.path.join(pick_path, parent_dir), exist_ok=True)
-
-                    if len(picks_[i]) == 0:
-                        ## keep an empty file for the file with no picks to make it easier to track processed files
-                        with open(
-                            os.path.join(pick_path, parent_dir, filename + '.csv'), 'a'
-                        ):
-                            pass
-                        continue
-                    picks_df = pd.DataFrame(picks_[i])
-                    picks_df['channel_index'] = picks_df['station_id'].apply(
-                        lambda x: int(x)
-                    )
-                    picks_df.sort_values(
-                        by=['channel_index', 'phase_index'], inplace=True
-                    )
-                    picks_df.to_csv(
-                        os.path.join(pick_path, parent_dir, filename + '.csv'),
-                        columns=[
-                            'channel_index',
-                            'phase_index',
-                            'phase_time',
-                            'phase_score',
-                            'phase_type',
-                        ],
-                        index=False,
+        The pool is spawned inside a worker that run_predict forked, so a run
+        starts processes x patch_workers patch processes on the same cores.
+        """
+        if args.patch_workers not in _patch_pool_cache:
+            if hasattr(os, 'sched_getaffinity'):
+                cores = sorted(os.sched_getaffinity(0))
+            else:
+                cores = list(range(os.cpu_count() or 1))
+            share = max(1, len(cores) // args.patch_workers)
+            threads = _worker_plan.get('torch_threads', len(cores))
+            plan = {
+                'torch_threads': max(1, threads // args.patch_workers),
+                'core_sets': [
+                    cores[i * share : (i + 1) * share] or cores
+                    for i in range(args.patch_workers)
+                ]
+                if _worker_plan.get('core_sets')
+                else None,
+            }
+            context = multiprocessing.get_context('spawn')
+            pool = ProcessPoolExecutor(
+                max_workers=args.patch_workers,
+                mp_context=context,
+                initializer=_init_patch_worker,
+                initargs=(self, plan, context.Value('i', 0)),
+            )
+            atexit.register(pool.shutdown)
+            _patch_pool_cache[args.patch_workers] = pool
+        return _patch_pool_cache[args.patch_workers]
+
+    def _das_batches(self, args, model, batches, timer):
+        """## Pick the DAS batches, yielding (meta, scores, picks, plot_picks) in input order.
+
+        With patch_workers the batches go to the patch pool, two per patch worker
+        in flight, so the data loading overlaps the forward passes.
+        """
+        if not args.patch_workers:
+            for meta in batches:
+                timer.lap('data')
+                result = self._das_picks(args, model, meta)
+                timer.lap('forward')
+                yield result
+            return
+        pool = self._patch_pool(args)
+        in_flight = deque()
+
+        def collect():
+            meta, scores, picks_, plot_picks, counts = in_flight.popleft().result()
+            for k, v in counts.items():
+                _trigger_counts[k] += v
+            timer.lap('forward')
+            return meta, scores, picks_, plot_picks
+
+        for meta in batches:
+            in_flight.append(pool.submit(_das_patch_picks, args, _to_cpu(meta)))
+            timer.lap('data')
+            if len(in_flight) >= 2 * args.patch_workers:
+                yield collect()
+        while in_flight:
+            yield collect()
+
+    def pred_phasenet_das(
+        self, args, model, data_loader, pick_path, figure_path, timer=None
+    ):
+        model.eval()
+        timer = timer or _StageTimer()
+        timer.mark()
+        store, pending = self._open_store(args), []
+        renderer = FigureRenderer.open(args)
+        reduced = args.das_channel_spacing > 1
+        with torch.inference_mode():
+            # for meta in metric_logger.log_every(data_loader, 1, header):
+            for meta, scores, picks_, plot_picks in self._das_batches(
+                args, model, self._iter_batches(args, data_loader), timer
+            ):
+                if store is None:
+                    for i in range(len(meta['file_name'])):
+                        tmp = meta['file_name'][i].split('/')
+                        parent_dir = '/'.join(tmp[-args.subdir_level - 1 : -1])
+                        filename = (
+                            tmp[-1].replace('*', '').replace(f'.{args.format}', '')
+                        )
+                        csv_dir = os.path.join(pick_path, parent_dir)
+                        if not os.path.exists(csv_dir):
+                            os.makedirs(csv_dir, exist_ok=True)
+
+                        if len(picks_[i]) == 0:
+                            ## keep an empty file for the file with no picks to make it easier to track processed files
+                            with open(os.path.join(csv_dir, filename + '.csv'), 'a'):
+                                pass
+                            continue
+                        picks_df = pd.DataFrame(picks_[i])
+                        picks_df['channel_index'] = picks_df['station_id'].apply(
+                            lambda x: int(x)
+                        )
+                        picks_df.sort_values(
+                            by=['channel_index', 'phase_index'], inplace=True
+                        )
+                        picks_df.to_csv(
+                            os.path.join(csv_dir, filename + '.csv'),
+                            columns=[
+                                'channel_index',
+                                'phase_index',
+                                'phase_time',
+                                'phase_score',
+                                'phase_type',
+                            ],
+                            index=False,
+                        )
+                else:
+                    self._store_picks(
+                        args, store, pending, picks_, meta['file_name']
                     )
 
+                timer.lap('write')
                 if args.plot_figure:
-                    plot_das(
+                    renderer.submit(
+                        plot_das,
                         meta['data'].cpu().float(),
                         scores.cpu().float(),
-                        picks=picks_,
+                        picks=plot_picks,
                         phases=args.phases,
                         file_name=meta['file_name'],
                         begin_time_index=meta['begin_time_index']
                         if 'begin_time_index' in meta
                         else None,
-                        begin_channel_index=meta['begin_channel_index']
-                        if 'begin_channel_index' in meta
-                        else None,
+                        # reduced data is drawn on the reduced channels
+                        begin_channel_index=None
+                        if reduced
+                        else meta.get('begin_channel_index'),
                         dt=meta['dt_s'] if 'dt_s' in meta else torch.tensor(0.01),
-                        dx=meta['dx_m'] if 'dx_m' in meta else torch.tensor(10.0),
+                        dx=(meta['dx_m'] if 'dx_m' in meta else torch.tensor(10.0))
+                        * args.das_channel_spacing,
                         figure_dir=figure_path,
                     )
 
+        if renderer is not None:
+            renderer.drain()
+
+        if store is not None:
+            store.flush()
+            # the dataset names patches, not files: record the files of the task
+            self._record_finished(args, pick_path, self._das_files(args))
+            return 0
+
         if args.distributed:
             torch.distributed.barrier()
             if args.cut_patch and utils.is_main_process():
                 merge_patch(
                     pick_path, pick_path.rstrip('_patch'), return_single_file=False
                 )
-        else:
+        elif args.merge_outputs:
             if args.cut_patch:
                 merge_patch(
                     pick_path, pick_path.rstrip('_patch'), return_single_file=False
@@ -679,7 +1802,229 @@ class PhaseNet:
 
         return 0
 
-    def predict(self, args):
+    def _load_model(self, args, device):
+        """## Build the model and load the pretrained weights."""
+        model = models.__dict__[args.model].build_model(
+            backbone=args.backbone,
+            in_channels=1,
+            out_channels=(len(args.phases) + 1),
+        )
+        # logger.info(f'Model:\n{model}')
+        model.to(device)
+
+        registry = ModelRegistry(args.model_dir)
+        if args.resume:
+            checkpoint = registry.load_checkpoint(args.resume)
+            # model.load_state_dict(checkpoint["model"], strict=True)
+            # print("Loaded checkpoint '{}' (epoch {})".format(self.args.resume, checkpoint["epoch"]))
+        else:
+            # downloaded and verified by run_predict, see _prepare_models
+            checkpoint = registry.load_checkpoint(
+                registry.path(args.model, args.location)
+            )
+
+            ## load model from wandb
+            # if utils.is_main_process():
+            #     with wandb.init() as run:
+            #         artifact = run.use_artifact(model_url, type="model")
+            #         artifact_dir = artifact.download()
+            #     checkpoint = torch.load(glob(os.path.join(artifact_dir, "*.pth"))[0], map_location="cpu")
+            #     model.load_state_dict(checkpoint["model"], strict=True)
+
+        model.load_state_dict(checkpoint['model'], strict=True)
+        return model
+
+    def _get_model(self, args, device):
+        """## Return the model of this worker process, loading it only once.
+
+        Distributed runs wrap the model in DDP, so they always get a fresh copy.
+        """
+        if args.distributed:
+            return self._load_model(args, device)
+        key = _model_key(args)
+        if key not in _model_cache:
+            start = time.perf_counter()
+            _model_cache[key] = self._load_model(args, device)
+            logging.info(
+                f'Loaded {args.model} in pid {os.getpid()} '
+                f'({time.perf_counter() - start:.2f} s)'
+            )
+        return _model_cache[key]
+
+    @staticmethod
+    def _onnx_path(args) -> Path:
+        """## Export path of the checkpoint, keyed by its sha256, backbone and opset.
+
+        A retrained or updated checkpoint gets a new path, so a stale export is
+        never picked up. The sha256 is only computed again when the checkpoint
+        changed, see ``ModelRegistry.record``.
+        """
+        registry = ModelRegistry(args.model_dir)
+        if args.resume:
+            weights = Path(args.resume)
+            prefix = weights.stem
+        else:
+            weights = registry.path(args.model, args.location)
+            prefix = args.model
+        sha256 = registry.record(weights)[:12]
+        return weights.with_name(
+            f'{prefix}_{args.backbone}_{sha256}_opset{_ONNX_OPSET}.onnx'
+        )
+
+    def _prepare_models(self):
+        """## Download and verify the model artifacts once before the workers start."""
+        registry = ModelRegistry(self.model_dir)
+        if self.resume:
+            registry.record(self.resume)  # the user's checkpoint may be retrained
+        else:
+            registry.fetch(self.model, self.location)
+        if self.engine == 'onnx':
+            registry.verify(self.export_onnx())
+        for model in self.extra_models:
+            location = self.location if (model, self.location) in model_urls else None
+            registry.fetch(model, location)
+
+    def export_onnx(self) -> Path:
+        """## Export the pretrained model to ONNX once and return its path."""
+        args = argparse.Namespace(**vars(self.args_list[0]))
+        args.device, args.distributed = 'cpu', False
+        onnx_path = self._onnx_path(args)
+        if onnx_path.exists():
+            return onnx_path
+        onnx_path.parent.mkdir(parents=True, exist_ok=True)
+        model = self._load_model(args, torch.device('cpu')).eval()
+        nx = 1 if args.model == 'phasenet' else 512
+        dummy = torch.zeros(1, 3 if args.model == 'phasenet' else 1, 4096, nx)
+        dynamic_axes = {0: 'batch', 2: 'nt', 3: 'nx'}
+        with torch.inference_mode():
+            torch.onnx.export(
+                _PhaseHead(model),
+                dummy,
+                str(onnx_path),
+                input_names=['data'],
+                output_names=['phase'],
+                dynamic_axes={'data': dynamic_axes, 'phase': dynamic_axes},
+                opset_version=_ONNX_OPSET,
+            )
+        try:
+            self._check_onnx(model, onnx_path, dummy.shape)
+        except Exception:
+            onnx_path.unlink(missing_ok=True)
+            raise
+        logging.info(f'Exported {args.model} to {onnx_path}')
+        return onnx_path
+
+    @staticmethod
+    def _check_onnx(model, onnx_path: Path, traced_shape, atol=1e-4):
+        """## Compare the exported graph with torch on a shape it was not traced with.
+
+        Padding and cropping inside the U-Net can be frozen to the traced size,
+        which gives wrong phases on other lengths without any error.
+        """
+        _, channels, nt, nx = traced_shape
+        shape = (2, channels, nt // 2 + 48, nx if nx == 1 else nx // 2 + 16)
+        data = torch.randn(*shape)
+        with torch.inference_mode():
+            expected = _PhaseHead(model)(data).numpy()
+        (phase,) = _OnnxModel.load(str(onnx_path)).session.run(
+            ['phase'], {'data': data.numpy()}
+        )
+        if phase.shape != expected.shape or not np.allclose(
+            phase, expected, atol=atol
+        ):
+            diff = (
+                np.abs(phase - expected).max()
+                if phase.shape == expected.shape
+                else f'shape {phase.shape} vs {expected.shape}'
+            )
+            raise ValueError(
+                f'ONNX export of {onnx_path.name} differs from torch on input '
+                f'{shape} ({diff}), the graph is not valid for dynamic shapes'
+            )
+
+    def _get_session(self, args) -> _OnnxModel:
+        """## Return the ONNX Runtime session of this worker process."""
+        onnx_path = str(self._onnx_path(args))
+        if onnx_path not in _session_cache:
+            # follow the thread plan of the worker instead of using every core
+            _session_cache[onnx_path] = _OnnxModel.load(
+                onnx_path, threads=torch.get_num_threads()
+            )
+        return _session_cache[onnx_path]
+
+    def _thread_plan(self, processes: int) -> dict:
+        """## Share the usable cores between workers, torch threads and loaders.
+
+        Every worker gets ``cores // processes`` cores. The ``workers`` data loader
+        workers the user asked for come out of that share and the rest goes to
+        torch intra-op threads, so a share too small for the loaders is logged
+        instead of changing ``workers``.
+        """
+        if hasattr(os, 'sched_getaffinity'):
+            cores = sorted(os.sched_getaffinity(0))
+        else:
+            cores = list(range(os.cpu_count() or 1))
+        share = max(1, len(cores) // processes)
+        loader_workers = self.workers
+        if loader_workers >= share:
+            logging.warning(
+                f'{loader_workers} loader workers per process leave no core of the '
+                f'{share} core share of a worker to torch'
+            )
+        torch_threads = self.torch_threads or max(1, share - loader_workers)
+        core_sets = [
+            cores[i * share : (i + 1) * share] or cores for i in range(processes)
+        ]
+        plan = {
+            'cores': len(cores),
+            'processes': processes,
+            'torch_threads': torch_threads,
+            'loader_workers': loader_workers,
+            'core_sets': core_sets if self.pin_workers else None,
+        }
+        logging.info(
+            f'Thread plan: {processes} processes x ({torch_threads} torch threads + '
+            f'{loader_workers} loader workers) on {len(cores)} cores'
+            + (', workers pinned' if self.pin_workers else '')
+        )
+        if processes * (torch_threads + loader_workers) > len(cores):
+            logging.warning('The thread plan oversubscribes the available cores')
+        return plan
+
+    def init_worker(self, plan: dict | None = None, counter=None):
+        """
+        Initializer for each worker in the pool. Loads the model once per process.
+
+        With a thread plan from ``_thread_plan``, the torch threads are limited and
+        the worker is pinned to the core set picked by the shared ``counter``.
+        """
+        if plan is not None:
+            _worker_plan.update(plan)
+            # torch is already imported here, so OMP_NUM_THREADS would not apply
+            torch.set_num_threads(plan['torch_threads'])
+            if plan['core_sets'] is not None and hasattr(os, 'sched_setaffinity'):
+                with counter.get_lock():
+                    index = counter.value
+                    counter.value += 1
+                core_set = plan['core_sets'][index % len(plan['core_sets'])]
+                os.sched_setaffinity(0, core_set)
+                logging.info(f'Worker {os.getpid()} pinned to cores {core_set}')
+        if not self.args_list:
+            return
+        start = time.perf_counter()
+        args = argparse.Namespace(**vars(self.args_list[0]))
+        args.distributed = False
+        if args.engine == 'onnx':
+            self._get_session(args)
+        else:
+            self._get_model(args, torch.device(args.device))
+        logging.info(
+            f'Worker {os.getpid()} started in {time.perf_counter() - start:.2f} s'
+        )
+
+    @staticmethod
+    def _output_paths(args):
+        """## Directories of picks, events and figures for one day."""
         result_path = args.result_path
         if args.cut_patch:
             pick_path = os.path.join(result_path, f'picks_{args.model}_patch', args.ymd)
@@ -693,6 +2038,133 @@ class PhaseNet:
             pick_path = os.path.join(result_path, f'picks_{args.model}', args.ymd)
             event_path = os.path.join(result_path, f'events_{args.model}', args.ymd)
             figure_path = os.path.join(result_path, f'figures_{args.model}', args.ymd)
+        return pick_path, event_path, figure_path
+
+    @staticmethod
+    def _file_signature(args, file_name: str) -> dict:
+        """## Identify the input of one station file and the model that picked it."""
+        pattern = file_name
+        if not os.path.isabs(pattern):
+            pattern = os.path.join(args.data_path, pattern)
+        files = []
+        for path in sorted(glob(pattern)):
+            stat = os.stat(path)
+            files.append([os.path.basename(path), stat.st_size, stat.st_mtime])
+        signature = {
+            'file_name': os.path.basename(file_name),
+            'files': files,
+            'model': f'{args.model}:{args.location}:{args.resume}',
+        }
+        if args.pick_store:  # the picks live in the parts of this task
+            signature['task'] = args.task_id
+        return signature
+
+    def _record_finished(self, args, pick_path: str, file_names: list):
+        """## Append the station files whose picks are written to the manifest."""
+        if args.model not in ['phasenet', 'phasenet_plus'] and not args.pick_store:
+            return
+        lines = [
+            json.dumps(self._file_signature(args, file_name)) + '\n'
+            for file_name in file_names
+        ]
+        with open(os.path.join(pick_path, 'manifest.jsonl'), 'a') as f:
+            f.write(''.join(lines))
+
+    def _skip_finished(self, args, pick_path: str, files: list | None = None) -> list:
+        """## Drop the station files of data_list that the manifest marks finished.
+
+        A file is finished when its input files, sizes, mtimes and model match the
+        manifest record and its pick csv exists (or it was written to the store).
+        """
+        files = args.data_list if files is None else files
+        manifest = os.path.join(pick_path, 'manifest.jsonl')
+        if not os.path.exists(manifest):
+            return files
+        finished = {}
+        with open(manifest) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # a line cut by a crash
+                    continue
+                finished[record['file_name']] = record
+        todo = []
+        for file_name in files:
+            tmp = file_name.split('/')
+            parent_dir = '/'.join(tmp[-args.subdir_level - 1 : -1])
+            csv_name = tmp[-1].replace('*', '').replace('?', '').replace('.mseed', '')
+            csv_path = os.path.join(pick_path, parent_dir, csv_name + '.csv')
+            if finished.get(tmp[-1]) == self._file_signature(
+                args, file_name
+            ) and (args.pick_store or os.path.exists(csv_path)):
+                continue
+            todo.append(file_name)
+        logging.info(f'{args.ymd}: skipping {len(files) - len(todo)} finished files')
+        return todo
+
+    def _task_finished(self, args) -> bool:
+        """## Whether the manifest marks every file of a pick store task finished.
+
+        Store tasks are resumed as a whole: an unfinished task is picked again and
+        replaces its parts. This also covers DAS, whose dataset only skips files
+        with a pick csv.
+        """
+        for task in [args, *[self._model_args(args, m) for m in args.extra_models]]:
+            if task.model == 'phasenet_das':
+                files = self._das_files(task)
+            else:
+                files = task.data_list
+            pick_path = self._output_paths(task)[0]
+            if not files or self._skip_finished(task, pick_path, files):
+                return False
+        return True
+
+    def _forget_finished(self, args):
+        """## Mark the files of a pick store task unfinished before its parts are replaced.
+
+        A crash while the task is picked again must not leave the manifest
+        pointing at parts that were already cleared.
+        """
+        for task in [args, *[self._model_args(args, m) for m in args.extra_models]]:
+            if task.model == 'phasenet_das':
+                files = self._das_files(task)
+            else:
+                files = task.data_list or []
+            lines = [
+                json.dumps({'file_name': os.path.basename(f), 'task': None}) + '\n'
+                for f in files
+            ]
+            pick_path = self._output_paths(task)[0]
+            with open(os.path.join(pick_path, 'manifest.jsonl'), 'a') as f:
+                f.write(''.join(lines))
+
+    @staticmethod
+    def _das_files(args) -> list:
+        if args.data_list is not None:
+            return pd.read_csv(args.data_list)['file_name'].tolist()
+        return sorted(str(x) for x in Path(args.data_path).glob(f'*.{args.format}'))
+
+    @staticmethod
+    def _set_dtype(args):
+        dtype = (
+            'bfloat16'
+            if torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+            else 'float16'
+        )
+        ptdtype = {
+            'float32': torch.float32,
+            'bfloat16': torch.bfloat16,
+            'float16': torch.float16,
+        }[dtype]
+        args.dtype, args.ptdtype = dtype, ptdtype
+
+    def predict(self, args):
+        if getattr(args, 'seam_days', None) is not None:
+            # seams are cut in the worker, not in the main process before the pool
+            seam_dir = self._build_seam(*args.seam_days)
+            args.data_list = self._check_data_list(None, seam_dir)
+        result_path = args.result_path
+        pick_path, event_path, figure_path = self._output_paths(args)
         if not os.path.exists(result_path):
             utils.mkdir(result_path)
         if not os.path.exists(pick_path):
@@ -702,6 +2174,10 @@ class PhaseNet:
         if not os.path.exists(figure_path):
             utils.mkdir(figure_path)
 
+        for model in args.extra_models:
+            for path in self._output_paths(self._model_args(args, model)):
+                os.makedirs(path, exist_ok=True)
+
         utils.init_distributed_mode(args)
 
         if args.distributed:
@@ -716,17 +2192,7 @@ class PhaseNet:
                 world_size = 1
 
         device = torch.device(args.device)
-        dtype = (
-            'bfloat16'
-            if torch.cuda.is_available() and torch.cuda.is_bf16_supported()
-            else 'float16'
-        )
-        ptdtype = {
-            'float32': torch.float32,
-            'bfloat16': torch.bfloat16,
-            'float16': torch.float16,
-        }[dtype]
-        args.dtype, args.ptdtype = dtype, ptdtype
+        self._set_dtype(args)
         torch.backends.cuda.matmul.allow_tf32 = True  # allow tf32 on matmul
         torch.backends.cudnn.allow_tf32 = True  # allow tf32 on cudnn
         if args.use_deterministic_algorithms:
@@ -735,27 +2201,31 @@ class PhaseNet:
         else:
             torch.backends.cudnn.benchmark = True
 
+        if args.pick_store:
+            if args.skip_existing and self._task_finished(args):
+                logging.info(f'{args.task_id}: all files are in the pick store')
+                return {}
+            self._forget_finished(args)
+        elif (
+            args.skip_existing
+            and args.model in ['phasenet', 'phasenet_plus']
+            and args.data_list
+        ):
+            todo = set(self._skip_finished(args, pick_path))
+            for model in args.extra_models:
+                extra = self._model_args(args, model)
+                todo.update(self._skip_finished(extra, self._output_paths(extra)[0]))
+            args.data_list = [f for f in args.data_list if f in todo]
+            if not args.data_list:
+                logging.info(f'{args.ymd}: all files are finished, reusing picks')
+                if args.merge_outputs:
+                    self._merge_outputs(args)
+                    for model in args.extra_models:
+                        self._merge_outputs(self._model_args(args, model))
+                return {}
+
         if args.model in ['phasenet', 'phasenet_plus']:
-            dataset = SeismicTraceIterableDataset(
-                data_path=args.data_path,
-                data_list=args.data_list,
-                hdf5_file=args.hdf5_file,
-                prefix=args.prefix,
-                format=args.format,
-                dataset=args.dataset,
-                training=False,
-                sampling_rate=args.sampling_rate,
-                highpass_filter=args.highpass_filter,
-                response_path=args.response_path,
-                response_xml=args.response_xml,
-                cut_patch=args.cut_patch,
-                resample_time=args.resample_time,
-                system=args.system,
-                nx=args.nx,
-                nt=args.nt,
-                rank=rank,
-                world_size=world_size,
-            )
+            dataset = self._seismic_dataset(args, rank, world_size)
             sampler = None
         elif args.model == 'phasenet_das':
             dataset = DASIterableDataset(
@@ -781,82 +2251,208 @@ class PhaseNet:
             raise ('Unknown model')  # type: ignore
         data_loader = torch.utils.data.DataLoader(
             dataset,
-            batch_size=args.batch_size,
+            # dynamic batching packs the single samples itself, see _iter_batches
+            batch_size=None
+            if args.batch_memory_mb is not None and args.model != 'phasenet_das'
+            else args.batch_size,
             sampler=sampler,
             num_workers=min(args.workers, mp.cpu_count()),
             collate_fn=None,
             drop_last=False,
         )
-        model = models.__dict__[args.model].build_model(
-            backbone=args.backbone,
-            in_channels=1,
-            out_channels=(len(args.phases) + 1),
-        )
-        # logger.info(f'Model:\n{model}')
-
-        model.to(device)
-        if args.distributed:
+        timer = _StageTimer()
+        with timer.stage('model_load'):
+            if args.engine == 'onnx':
+                model = self._get_session(args)
+            else:
+                model = self._get_model(args, device)
+            extras = [self._model_args(args, m) for m in args.extra_models]
+            extra_models = [self._get_model(extra, device) for extra in extras]
+        if args.distributed and args.engine == 'torch':
             model = torch.nn.SyncBatchNorm.convert_sync_batchnorm(model)
+            torch.distributed.barrier()
+            model = torch.nn.parallel.DistributedDataParallel(
+                model, device_ids=[args.gpu]
+            )
 
-        if args.resume:
-            checkpoint = torch.load(args.resume, map_location='cpu')
-            # model.load_state_dict(checkpoint["model"], strict=True)
-            # print("Loaded checkpoint '{}' (epoch {})".format(self.args.resume, checkpoint["epoch"]))
-        else:
-            if args.model == 'phasenet':
-                if args.location is None:
-                    model_url = 'https://github.com/AI4EPS/models/releases/download/PhaseNet-v1/model_99.pth'
-            elif args.model == 'phasenet_plus':
-                if args.location is None:
-                    model_url = 'https://github.com/AI4EPS/models/releases/download/PhaseNet-Plus-v1/model_99.pth'
-                elif args.location == 'LCSN':
-                    model_url = 'https://github.com/AI4EPS/models/releases/download/PhaseNet-Plus-LCSN/model_99.pth'
-            elif args.model == 'phasenet_das':
-                if args.location is None:
-                    # model_url = "https://github.com/AI4EPS/models/releases/download/PhaseNet-DAS-v0/PhaseNet-DAS-v0.pth"
-                    model_url = 'https://github.com/AI4EPS/models/releases/download/PhaseNet-DAS-v1/PhaseNet-DAS-v1.pth'
-                elif args.location == 'forge':
-                    model_url = 'https://github.com/AI4EPS/models/releases/download/PhaseNet-DAS-ConvertedPhase/model_99.pth'
-                else:
-                    raise ('Missing pretrained model for this location')  # type: ignore
+        _trigger_counts.clear()
+        with timer.stage('inference'):
+            if not extras:
+                self._run_pred(args, model, data_loader, timer)
             else:
-                raise
-            checkpoint = torch.hub.load_state_dict_from_url(
-                model_url,
-                model_dir=f'./model_{args.model}',
-                progress=True,
-                check_hash=True,
-                map_location='cpu',
+                # one decoding pass feeds every model, each in its own thread
+                broadcast = _Broadcast(data_loader, 1 + len(extras))
+                timers = [_StageTimer() for _ in broadcast.views]
+                with ThreadPoolExecutor(max_workers=len(broadcast.views)) as executor:
+                    futures = [
+                        executor.submit(
+                            self._run_pred, task, task_model, view, view_timer
+                        )
+                        for task, task_model, view, view_timer in zip(
+                            [args, *extras],
+                            [model, *extra_models],
+                            broadcast.views,
+                            timers,
+                        )
+                    ]
+                    for future in futures:
+                        future.result()
+                # the views run concurrently, the extra models get their own stages
+                for task, view_timer in zip([args, *extras], timers):
+                    prefix = '' if task is args else f'{task.model} '
+                    for stage, seconds in view_timer.totals.items():
+                        timer.totals[prefix + stage] += seconds
+        logging.info(f'{args.ymd} (pid {os.getpid()}): {timer.report()}')
+        if args.trigger:
+            logging.info(
+                f'{args.ymd}: triggered inference skipped '
+                f'{self._skipped_fraction(_trigger_counts):.1%} of the data'
             )
+            # sample counts travel with the stage timings to run_predict
+            return {**timer.totals, **_trigger_counts}
+        # return os.path.join(pick_path, 'picks.csv')
+        return dict(timer.totals)
 
-            ## load model from wandb
-            # if utils.is_main_process():
-            #     with wandb.init() as run:
-            #         artifact = run.use_artifact(model_url, type="model")
-            #         artifact_dir = artifact.download()
-            #     checkpoint = torch.load(glob(os.path.join(artifact_dir, "*.pth"))[0], map_location="cpu")
-            #     model.load_state_dict(checkpoint["model"], strict=True)
+    def _run_pred(self, args, model, data_loader, timer=None):
+        """## Run the prediction loop of args.model on a data loader.
 
-        model_without_ddp = model
-        if args.distributed:
-            torch.distributed.barrier()
-            model = torch.nn.parallel.DistributedDataParallel(
-                model, device_ids=[args.gpu]
+        The data, forward, postprocess and write time of the loop go to ``timer``.
+        """
+        pick_path, event_path, figure_path = self._output_paths(args)
+        try:
+            if args.model == 'phasenet':
+                self.pred_phasenet(
+                    args, model, data_loader, pick_path, figure_path, timer
+                )
+
+            if args.model == 'phasenet_plus':
+                self.pred_phasenet_plus(
+                    args, model, data_loader, pick_path, event_path, figure_path, timer
+                )
+
+            if args.model == 'phasenet_das':
+                self.pred_phasenet_das(
+                    args, model, data_loader, pick_path, figure_path, timer
+                )
+        finally:
+            if isinstance(data_loader, _Broadcast._View):
+                data_loader.closed = True
+
+    def _build_seam(self, prev_path: str, next_path: str, ymd: str) -> Path:
+        """## Cut the data around the midnight that starts ymd into seam files.
+
+        The tail of the previous day and the head of the next day are merged per
+        trace and written with the usual ``.D.`` naming, so _check_data_list groups
+        them by station like a normal day directory.
+        """
+        midnight = UTCDateTime(datetime.strptime(ymd, '%Y%m%d'))
+        seam_dir = self.result_path / 'seam' / ymd
+        seam_dir.mkdir(parents=True, exist_ok=True)
+        st = Stream()
+        for data_path, t1, t2 in [
+            (Path(prev_path), midnight - self.day_overlap, midnight),
+            (Path(next_path), midnight, midnight + self.day_overlap),
+        ]:
+            for path in data_path.glob(f'*{self.format}'):
+                st += read(path, starttime=t1, endtime=t2)
+        st.merge(method=1, fill_value='latest')
+        for tr in st:
+            if tr.stats.npts == 0:
+                continue
+            tr.write(
+                str(seam_dir / f'{tr.id}.D.seam.{self.format}'),
+                format=self.format.upper(),
             )
-            model_without_ddp = model.module
-        model_without_ddp.load_state_dict(checkpoint['model'], strict=True)
+        return seam_dir
 
-        if args.model == 'phasenet':
-            self.pred_phasenet(args, model, data_loader, pick_path, figure_path)
+    def _seam_args(self) -> list:
+        """## Tasks picking the overlap around every midnight inside the range.
 
-        if args.model == 'phasenet_plus':
-            self.pred_phasenet_plus(
-                args, model, data_loader, pick_path, event_path, figure_path
+        Only the task is made here, its worker cuts the seam files in ``predict``.
+        """
+        if not self.day_overlap or self.model == 'phasenet_das':
+            return []
+        seam_args = []
+        for prev_args, next_args in zip(self.args_list[:-1], self.args_list[1:]):
+            prev_day = datetime.strptime(prev_args.ymd, '%Y%m%d')
+            if prev_day + timedelta(days=1) != datetime.strptime(
+                next_args.ymd, '%Y%m%d'
+            ):
+                continue
+            seam = self._build_args(
+                self.result_path / 'seam' / next_args.ymd, None, f'{next_args.ymd}_seam'
             )
+            seam.seam_days = (prev_args.data_path, next_args.data_path, next_args.ymd)
+            seam_args.append(seam)
+        logging.info(f'Picking {len(seam_args)} midnight seams')
+        return seam_args
 
-        if args.model == 'phasenet_das':
-            self.pred_phasenet_das(args, model, data_loader, pick_path, figure_path)
-        # return os.path.join(pick_path, 'picks.csv')
+    def _prune_store(self, tasks: list):
+        """## Remove the store parts of the days in the range that no task writes.
+
+        Parts are named by task, so a different files_per_task than the last run
+        would otherwise leave the old parts next to the new ones.
+        """
+        days = {task.ymd[:8] for task in tasks}
+        names = {task.task_id for task in tasks}
+        for model in [self.model, *self.extra_models]:
+            store = PickStore(self.result_path / f'picks_{model}' / 'store')
+            store.prune(days, names)
+
+    def _split_tasks(self, args_list: list) -> list:
+        """## Split every day into tasks of at most ``files_per_task`` files.
+
+        Seismometer tasks carry a slice of the day's ``data_list``; DAS tasks carry a
+        csv list of hdf5 files, which is how ``DASIterableDataset`` reads a data list.
+        Per-file outputs land in the same day directory, so they are merged once
+        per day after all tasks are done.
+        """
+        if self.files_per_task is None:
+            return args_list
+        task_dir = self.result_path / 'task_lists'
+        tasks = []
+        for args in args_list:
+            if args.model == 'phasenet_das':
+                files = sorted(Path(args.data_path).glob(f'*.{args.format}'))
+            else:
+                files = args.data_list
+            if not files:
+                tasks.append(args)
+                continue
+            for i in range(0, len(files), self.files_per_task):
+                chunk = files[i : i + self.files_per_task]
+                if args.model == 'phasenet_das':
+                    task_dir.mkdir(parents=True, exist_ok=True)
+                    chunk_id = i // self.files_per_task
+                    chunk_list = task_dir / f'{args.ymd}_{chunk_id:04d}.csv'
+                    pd.DataFrame({'file_name': [str(f) for f in chunk]}).to_csv(
+                        chunk_list, index=False
+                    )
+                    chunk = str(chunk_list)
+                task = argparse.Namespace(**vars(args))
+                task.data_list = chunk
+                task.task_id = f'{args.ymd}_{i // self.files_per_task:04d}'
+                task.merge_outputs = False
+                tasks.append(task)
+        logging.info(
+            f'Split {len(args_list)} days into {len(tasks)} tasks '
+            f'of up to {self.files_per_task} files'
+        )
+        return tasks
+
+    def _merge_outputs(self, args):
+        """## Merge the per-file outputs of one day into the daily files."""
+        pick_path, event_path, _ = self._output_paths(args)
+        if args.model == 'phasenet' and not args.pick_store:
+            merge_picks(pick_path)
+        elif args.model == 'phasenet_plus':
+            if not args.pick_store:
+                merge_picks(pick_path)
+            merge_events(event_path)
+        elif args.model == 'phasenet_das' and args.cut_patch:
+            if args.pick_store:
+                return
+            merge_patch(pick_path, pick_path.rstrip('_patch'), return_single_file=False)
 
     def run_predict(self, processes=3):
         logging.basicConfig(
@@ -865,12 +2461,314 @@ class PhaseNet:
             level=logging.INFO,
             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         )
-        """## Main function to run."""
-        with multiprocessing.Pool(processes=processes) as pool:
-            pool.map(self.predict, self.args_list)
-        self.concat_picks(
-            date_list=self.date_list,
-            result_path=self.result_path,
-            model=self.model,
-            dir_name=self.dir_name,
+        """## Main function to run.
+
+        Every worker process loads the model once in ``init_worker`` and keeps it
+        for all the tasks it handles. With ``files_per_task`` the days are split
+        into file groups which idle workers take one at a time. The workers are
+        not daemonic, so they can start their own figure rendering pool.
+
+        Returns the stage timings (s) summed over all the tasks.
+        """
+        start = time.perf_counter()
+        self._prepare_models()
+        seam_args = self._seam_args()
+        tasks = self._split_tasks(self.args_list + seam_args)
+        plan = self._thread_plan(processes)
+        if self.patch_workers and processes > 1:
+            logging.info(
+                f'{processes} workers x {self.patch_workers} patch workers share '
+                f"each worker's {plan['torch_threads']} torch threads"
+            )
+        if self.pick_store:
+            self._prune_store(tasks)
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=self.init_worker,
+            initargs=(plan, multiprocessing.Value('i', 0)),
+        ) as executor:
+            timings = list(executor.map(self.predict, tasks))
+        if self.files_per_task is not None:
+            for args in self.args_list + seam_args:
+                self._merge_outputs(args)
+                for model in self.extra_models:
+                    self._merge_outputs(self._model_args(args, model))
+        total = defaultdict(float)
+        for timing in timings:
+            for stage, seconds in timing.items():
+                total[stage] += seconds
+        if self.trigger:
+            counts = {k: total.pop(k, 0) for k in ['trigger_samples', 'model_samples']}
+            logging.info(
+                f'Triggered inference skipped {self._skipped_fraction(counts):.1%} '
+                'of the data'
+            )
+        summary = ', '.join(f'{k}: {v:.2f} s' for k, v in total.items())
+        logging.info(
+            f'PhaseNet picking took {time.perf_counter() - start:.2f} s '
+            f'(summed over days: {summary})'
+        )
+        for model in [self.model, *self.extra_models]:
+            self.concat_picks(
+                date_list=self.date_list + [args.ymd for args in seam_args],
+                result_path=self.result_path,
+                model=model,
+                dir_name=self.dir_name,
+                pick_store=self.pick_store,
+                dedup_tolerance=self.dedup_tolerance if seam_args else None,
+            )
+        return dict(total)
+
+    def _scan_new_files(self, seen: dict, pending: dict) -> list:
+        """## Find the files in data_parent_dir that are new or have grown.
+
+        A file is only returned once its size did not change between two polls, so
+        segments that are still being written are not read half way. The files
+        under result_path, e.g. the stream windows, are never input.
+
+        ### Returns:
+            - ready (list): (path, arrival) tuples, arrival is the time.time() at which
+              the current version of the file was first seen.
+        """
+        ready = []
+        now = time.time()
+        output_dir = self.result_path.resolve()
+        for path in sorted(self.data_parent_dir.rglob(f'*{self.format}')):
+            if path.resolve().is_relative_to(output_dir):
+                continue
+            stat = path.stat()
+            signature = (stat.st_size, stat.st_mtime)
+            if seen.get(path) == signature:
+                continue
+            if path in pending and pending[path][0] == signature:
+                ready.append((path, pending.pop(path)[1]))
+                seen[path] = signature
+            else:
+                pending[path] = (signature, now)
+        return ready
+
+    def _read_new(self, path: Path, offsets: dict) -> Stream:
+        """## Read the part of a segment file that was not read at the last poll.
+
+        MiniSEED records are independent, so a grown file is read from the byte
+        where the last read stopped. Other formats are read whole and the samples
+        already buffered are dropped by ``_buffer_trace``.
+        """
+        if self.format.lower() != 'mseed':
+            return read(path)
+        offset = offsets.get(path, 0)
+        if path.stat().st_size < offset:  # replaced, not appended
+            offset = 0
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        offsets[path] = offset + len(data)
+        if not data:
+            return Stream()
+        return read(io.BytesIO(data), format='MSEED')
+
+    @staticmethod
+    def _buffer_trace(buffers: dict, trace, arrival: float, overlap: float):
+        """## Append a trace to the ring buffer of its station."""
+        stats = trace.stats
+        key = f'{stats.network}.{stats.station}.{stats.location}.{stats.channel[:-1]}'
+        state = buffers.setdefault(
+            key, {'stream': Stream(), 'emitted_until': None, 'arrival': arrival}
+        )
+        buffered = state['stream'].select(channel=stats.channel)
+        if len(buffered) > 0:
+            # a growing file is read again, only keep the samples not buffered yet
+            trace.trim(starttime=buffered[0].stats.endtime + stats.delta)
+            if stats.npts == 0:
+                return
+        state['stream'] += trace
+        state['stream'].merge(method=1, fill_value='latest')
+        state['arrival'] = arrival
+        state['updated'] = True
+        if state['emitted_until'] is not None:
+            # keep the receptive-field overlap in front of the unpicked data only
+            state['stream'].trim(starttime=state['emitted_until'] - overlap)
+
+    def _stream_window(self, args, model, key: str, state: dict, overlap: float):
+        """## Pick the buffered data of one station.
+
+        The buffer is written as one file per trace and read back through the
+        dataset of the batch run, so the preprocessing, peak detection and pick
+        columns (e.g. phase_amplitude) are the same. Picks are emitted from the end
+        of the previous window up to ``overlap`` seconds before the end of the
+        buffer; the rest is picked again with more context when the next segment
+        arrives.
+        """
+        st = state['stream'].copy()
+        start = max(tr.stats.starttime for tr in st)
+        end = min(tr.stats.endtime for tr in st)
+        emitted_until = state['emitted_until'] or start
+        if end - overlap <= emitted_until:
+            return []
+        # only the new span and the overlap in front of it are picked
+        st.trim(starttime=max(start, emitted_until - overlap), endtime=end)
+        window_dir = self.result_path / 'stream_windows' / key
+        window_dir.mkdir(parents=True, exist_ok=True)
+        for tr in st:
+            tr.write(
+                str(window_dir / f'{tr.id}.D.stream.{self.format}'),
+                format=self.format.upper(),
+            )
+        task = argparse.Namespace(**vars(args))
+        task.data_path = str(window_dir)
+        task.data_list = self._check_data_list(None, window_dir)
+        data_loader = torch.utils.data.DataLoader(
+            self._seismic_dataset(task), batch_size=1, num_workers=0
+        )
+        picks = []
+        with torch.inference_mode():
+            for meta in data_loader:
+                with self._autocast(args):
+                    output = model(meta)
+                    meta, output = self.postprocess(meta, output)
+                _, phase_picks = self._phase_picks(args, meta, output)
+                for picks_ in phase_picks:
+                    picks.extend(
+                        pick
+                        for pick in picks_
+                        if emitted_until
+                        <= UTCDateTime(pick['phase_time'])
+                        < end - overlap
+                    )
+        state['emitted_until'] = end - overlap
+        return picks
+
+    @staticmethod
+    def _seismic_dataset(args, rank=0, world_size=1):
+        """## Seismometer dataset of a task, shared by the batch and stream runs."""
+        return SeismicTraceIterableDataset(
+            data_path=args.data_path,
+            data_list=args.data_list,
+            hdf5_file=args.hdf5_file,
+            prefix=args.prefix,
+            format=args.format,
+            dataset=args.dataset,
+            training=False,
+            sampling_rate=args.sampling_rate,
+            highpass_filter=args.highpass_filter,
+            response_path=args.response_path,
+            response_xml=args.response_xml,
+            cut_patch=args.cut_patch,
+            resample_time=args.resample_time,
+            system=args.system,
+            nx=args.nx,
+            nt=args.nt,
+            rank=rank,
+            world_size=world_size,
+        )
+
+    def _stream_das_file(self, args, path: Path) -> pd.DataFrame:
+        """## Pick one new DAS file through the regular DAS workflow."""
+        task = argparse.Namespace(**vars(args))
+        task_dir = self.result_path / 'task_lists'
+        task_dir.mkdir(parents=True, exist_ok=True)
+        task.data_list = str(task_dir / f'stream_{path.stem}.csv')
+        pd.DataFrame({'file_name': [str(path)]}).to_csv(task.data_list, index=False)
+        task.merge_outputs = False
+        task.task_id = f'stream_{path.stem}'
+        self.predict(task)
+        pick_path, _, _ = self._output_paths(task)
+        try:
+            df = pd.read_csv(Path(pick_path) / f'{path.stem}.csv')
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            return pd.DataFrame()
+        df['station_id'] = das_station_id(df['channel_index'])
+        return df
+
+    def run_stream(
+        self,
+        poll_interval=10.0,
+        overlap=30.0,
+        max_polls: int | None = None,
+        on_picks=None,
+    ):
+        """## Keep picking the segments that arrive in data_parent_dir.
+
+        Seismometer segments are appended to a ring buffer per station, which keeps
+        ``overlap`` seconds in front of the unpicked data as model context. DAS
+        files are picked one by one as they arrive. New picks are appended to
+        ``picks_{model}/stream/picks.csv`` and the latency from data arrival to pick
+        output is kept in ``self.stream_latency``.
+
+        ### Args:
+            - poll_interval (float, optional): Seconds between two scans of data_parent_dir. Defaults to 10.0.
+            - overlap (float, optional): Seconds of context kept around each window, should cover the receptive field of the model. Defaults to 30.0.
+            - max_polls (int | None, optional): Stop after this many scans. If None, run until interrupted. Defaults to None.
+            - on_picks (Callable | None, optional): Called with the DataFrame of every new batch of picks. Defaults to None.
+        """
+        args = self._build_args(self.data_parent_dir, None, 'stream')
+        args.distributed = False
+        self._set_dtype(args)
+        stream_picks = self.result_path / f'picks_{self.model}' / 'stream' / 'picks.csv'
+        stream_picks.parent.mkdir(parents=True, exist_ok=True)
+        self._prepare_models()
+        if self.model != 'phasenet_das':
+            if args.engine == 'onnx':
+                model = self._get_session(args)
+            else:
+                model = self._get_model(args, torch.device(args.device))
+            model.eval()
+        self.stream_latency = []
+        buffers = {}
+        seen, pending, offsets = {}, {}, {}
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            new_picks = []
+            for path, arrival in self._scan_new_files(seen, pending):
+                if self.model == 'phasenet_das':
+                    df = self._stream_das_file(args, path)
+                    self.stream_latency.append(
+                        {'source': path.name, 'latency_s': time.time() - arrival}
+                    )
+                    if not df.empty:
+                        new_picks.append(df)
+                    continue
+                for trace in self._read_new(path, offsets):
+                    self._buffer_trace(buffers, trace, arrival, overlap)
+
+            for key, state in buffers.items():
+                if not state.pop('updated', False):
+                    continue
+                picks = self._stream_window(args, model, key, state, overlap)
+                self.stream_latency.append(
+                    {'source': key, 'latency_s': time.time() - state['arrival']}
+                )
+                if picks:
+                    new_picks.append(pd.DataFrame(picks))
+
+            if new_picks:
+                df = pd.concat(new_picks, ignore_index=True)
+                df.to_csv(
+                    stream_picks,
+                    mode='a',
+                    header=not stream_picks.exists(),
+                    index=False,
+                )
+                if on_picks is not None:
+                    on_picks(df)
+                logging.info(
+                    f'{len(df)} new picks, latency: {self.stream_latency_stats()}'
+                )
+            if max_polls is None or polls < max_polls:
+                time.sleep(poll_interval)
+
+    def stream_latency_stats(self) -> dict:
+        """## Summary (s) of the latency from data arrival to pick output."""
+        latency = np.array(
+            [x['latency_s'] for x in getattr(self, 'stream_latency', [])]
         )
+        if latency.size == 0:
+            return {}
+        return {
+            'count': int(latency.size),
+            'mean': float(latency.mean()),
+            'p50': float(np.percentile(latency, 50)),
+            'p95': float(np.percentile(latency, 95)),
+            'max': float(latency.max()),
+        }
@@ -0,0 +1,392 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# Lengths (s) of the Magnitude windows that start 3 s before a pick: 20/40/80 s
+# for a P pick without S by distance, 30 s for an S pick without P, and 80 s for
+# a P-S pair more than 37.5 s apart. Closer pairs use the ``pair`` window, from
+# 3 s before the P pick over twice the S-P time plus 5 s.
+amplitude_windows = (20, 30, 40, 80)
+
+# Peaks per window: raw and detrended for the threshold code, Wood-Anderson for
+# code 1 and bandpassed Wood-Anderson for code 2.
+amplitude_names = [
+    'amp',
+    'amp_detrend',
+    'wa_amp_e',
+    'wa_amp_n',
+    'wa_bp_amp_e',
+    'wa_bp_amp_n',
+]
+
+# Columns added to the picks by ``magnitude.peak_amplitudes``; ``pair_time`` is
+# the S pick the ``pair`` window of a P pick was cut for.
+amplitude_columns = [
+    'instrument',
+    'pair_time',
+    *(
+        f'{name}_{length}'
+        for length in (*amplitude_windows, 'pair')
+        for name in amplitude_names
+    ),
+]
+
+# Types of the known pick columns; other columns keep the type pandas infers.
+pick_schema = {
+    'station_id': pa.string(),
+    'phase_index': pa.int64(),
+    'phase_time': pa.timestamp('us'),
+    'phase_score': pa.float32(),
+    'phase_type': pa.string(),
+    'channel_index': pa.int32(),
+    'phase_polarity': pa.float32(),
+    'phase_amplitude': pa.float32(),
+    'instrument': pa.string(),
+    'pair_time': pa.timestamp('us'),
+    **{name: pa.float32() for name in amplitude_columns[2:]},
+}
+
+
+def _typed_table(df: pd.DataFrame) -> pa.Table:
+    """Convert a picks DataFrame into an arrow table with the store types."""
+    df = df.copy()
+    df['phase_time'] = pd.to_datetime(df['phase_time'])
+    df['date'] = df['phase_time'].dt.strftime('%Y%m%d')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for name, dtype in pick_schema.items():
+        if name in table.column_names:
+            table = table.set_column(
+                table.column_names.index(name),
+                name,
+                pc.cast(table.column(name), dtype, safe=False),
+            )
+    return table
+
+
+class PickStore:
+    """## Append-only, day-partitioned Parquet store of picks.
+
+    Picks are buffered in memory and written as ``date=YYYYMMDD/part-*.parquet``
+    files, so many processes can append to the same store without locking and
+    readers only open the days and columns they ask for. A named writer writes
+    ``part-{name}-{n}.parquet``, so picking the same task again can ``clear`` its
+    earlier parts instead of adding a second copy of its picks.
+
+    ### Args:
+        - root (Path): Directory of the store.
+        - flush_rows (int, optional): Number of buffered picks that triggers a write. Defaults to 100000.
+        - name (str | None, optional): Name of the parts of this writer, e.g. the picking task. If None, a unique name per write. Defaults to None.
+    """
+
+    def __init__(self, root: Path, flush_rows=100_000, name: str | None = None):
+        self.root = Path(root)
+        self.flush_rows = flush_rows
+        self.name = name
+        self._buffer: list[pd.DataFrame] = []
+        self.buffered_rows = 0
+        self._parts = 0
+
+    @staticmethod
+    def _part_name(path: Path) -> str:
+        """Writer name of a ``part-{name}-{n}.parquet`` file."""
+        return path.stem[len('part-') :].rsplit('-', 1)[0]
+
+    def clear(self):
+        """## Remove the parts written under this writer's name."""
+        if self.name is None:
+            return
+        for path in self.root.glob('date=*/part-*.parquet'):
+            if self._part_name(path) == self.name:
+                path.unlink()
+
+    def prune(self, days: set, keep: set):
+        """## Remove the named parts of the given days whose name is not in keep.
+
+        Names start with the day (YYYYMMDD) of their task, so the parts left by
+        tasks that no longer exist, e.g. after files_per_task changed, are found.
+        """
+        for path in self.root.glob('date=*/part-*.parquet'):
+            name = self._part_name(path)
+            if name[:8] in days and name not in keep:
+                path.unlink()
+
+    def append(self, picks: pd.DataFrame) -> bool:
+        """## Buffer picks, returns True when the buffer was written to disk."""
+        if picks.empty:
+            return False
+        self._buffer.append(picks)
+        self.buffered_rows += len(picks)
+        if self.buffered_rows >= self.flush_rows:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        """## Write the buffered picks, one part file per day."""
+        if not self._buffer:
+            return
+        table = _typed_table(pd.concat(self._buffer, ignore_index=True))
+        self._buffer, self.buffered_rows = [], 0
+        if self.name is None:
+            part = f'part-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet'
+        else:
+            part = f'part-{self.name}-{self._parts:05d}.parquet'
+            self._parts += 1
+        dates = table.column('date')
+        for date in pc.unique(dates).to_pylist():
+            day = table.filter(pc.equal(dates, date)).drop(['date'])
+            day_dir = self.root / f'date={date}'
+            day_dir.mkdir(parents=True, exist_ok=True)
+            pq.write_table(day.sort_by('phase_time'), day_dir / part)
+
+    def read(
+        self,
+        columns: list | None = None,
+        dates: list | None = None,
+        start: str | None = None,
+        end: str | None = None,
+        stations: list | None = None,
+    ) -> pd.DataFrame:
+        """## Read picks with partition, time, station and column pruning.
+
+        ### Args:
+            - columns (list | None, optional): Columns to read. If None, all columns. Defaults to None.
+            - dates (list | None, optional): Days (YYYYMMDD) to read. Defaults to None.
+            - start (str | None, optional): Earliest phase_time to read. Defaults to None.
+            - end (str | None, optional): Latest phase_time to read. Defaults to None.
+            - stations (list | None, optional): station_id to read. Defaults to None.
+        """
+        if not self.root.exists():
+            logging.warning(f'{self.root} does not exist, no picks to read')
+            return pd.DataFrame(columns=columns)
+        # the day keys stay strings, hive inference would make them int32
+        partitioning = ds.partitioning(
+            pa.schema([('date', pa.string())]), flavor='hive'
+        )
+        dataset = ds.dataset(self.root, format='parquet', partitioning=partitioning)
+        expr = None
+
+        def _and(expr, other):
+            return other if expr is None else expr & other
+
+        if dates is not None:
+            expr = _and(expr, ds.field('date').isin([str(x) for x in dates]))
+        if start is not None:
+            start = pd.Timestamp(start)
+            expr = _and(expr, ds.field('date') >= start.strftime('%Y%m%d'))
+            start_us = pa.scalar(start, pa.timestamp('us'))
+            expr = _and(expr, ds.field('phase_time') >= start_us)
+        if end is not None:
+            end = pd.Timestamp(end)
+            expr = _and(expr, ds.field('date') <= end.strftime('%Y%m%d'))
+            end_us = pa.scalar(end, pa.timestamp('us'))
+            expr = _and(expr, ds.field('phase_time') <= end_us)
+        if stations is not None:
+            expr = _and(expr, ds.field('station_id').isin(list(stations)))
+        if columns is not None:
+            columns = [c for c in columns if c in dataset.schema.names]
+        table = dataset.to_table(columns=columns, filter=expr)
+        if 'date' in table.column_names and (columns is None or 'date' not in columns):
+            table = table.drop(['date'])
+        df = table.to_pandas()
+        if 'phase_time' in df:
+            df = df.sort_values('phase_time', ignore_index=True)
+        return df
+
+
+def read_picks(
+    picks: Path,
+    columns: list | None = None,
+    start: str | None = None,
+    end: str | None = None,
+) -> pd.DataFrame:
+    """## Read picks from a csv, a Parquet file or a PickStore directory.
+
+    Only the given columns that exist in the picks are loaded; Parquet inputs also
+    skip the row groups outside start and end.
+    """
+    picks = Path(picks)
+    if picks.is_dir():
+        return PickStore(picks).read(columns=columns, start=start, end=end)
+    if picks.suffix == '.parquet':
+        if columns is not None:
+            names = pq.read_schema(picks).names
+            columns = [c for c in columns if c in names]
+        filters = []
+        if start is not None:
+            filters.append(('phase_time', '>=', pd.Timestamp(start)))
+        if end is not None:
+            filters.append(('phase_time', '<=', pd.Timestamp(end)))
+        return pd.read_parquet(picks, columns=columns, filters=filters or None)
+    df = pd.read_csv(
+        picks, usecols=None if columns is None else (lambda c: c in columns)
+    )
+    if start is not None or end is not None:
+        phase_time = pd.to_datetime(df['phase_time'])
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= phase_time >= pd.Timestamp(start)
+        if end is not None:
+            mask &= phase_time <= pd.Timestamp(end)
+        df = df[mask]
+    return df
+
+
+# PickIndex of this process per file: path -> (mtime, columns, index).
+_index_cache: dict = {}
+
+
+def index_dir(picks: Path) -> Path:
+    """## Directory next to a picks file that keeps its sorted index for later runs."""
+    return Path(picks).resolve().parent / 'pick_index'
+
+
+def _arrow_strings(dtype: pa.DataType):
+    """Keep the string columns of a cached index in Arrow memory."""
+    if pa.types.is_string(dtype) or pa.types.is_large_string(dtype):
+        return pd.ArrowDtype(dtype)
+    return None
+
+
+class PickIndex:
+    """## Picks sorted by phase_time with categorical station and phase codes.
+
+    ``query`` finds the time range by binary search on the sorted times and the
+    stations and phases by their integer codes, so no row outside the answer is
+    compared. The picks keep their original phase_time values, e.g. the ISO strings
+    of a csv. ``open`` caches the latest index of a file in the process and, with a
+    cache_dir, also keeps it on disk for later runs.
+
+    ### Args:
+        - picks (pd.DataFrame): Picks with at least station_id, phase_time and phase_type.
+        - times (np.ndarray | None, optional): Sorted datetime64 phase_time of presorted picks. If None, the picks are sorted. Defaults to None.
+    """
+
+    def __init__(self, picks: pd.DataFrame, times: np.ndarray | None = None):
+        if times is None:
+            times = pd.to_datetime(picks['phase_time']).to_numpy()
+            order = np.argsort(times, kind='stable')
+            picks = picks.iloc[order].reset_index(drop=True)
+            times = times[order]
+            for column in ['station_id', 'phase_type']:
+                if column in picks:
+                    picks[column] = picks[column].astype('category')
+        self.picks = picks
+        self._times = times
+
+    @classmethod
+    def open(
+        cls,
+        picks: Path,
+        columns: list | None = None,
+        cache_dir: Path | None = None,
+    ) -> PickIndex:
+        """## Load the index of a csv, a Parquet file or a PickStore directory.
+
+        ### Args:
+            - picks (Path): Picks to index.
+            - columns (list | None, optional): Columns to keep. If None, all columns. Defaults to None.
+            - cache_dir (Path | None, optional): Directory to keep the sorted picks of a file in, reused while newer than the file. If None, nothing is written. Defaults to None.
+        """
+        picks = Path(picks)
+        if picks.is_dir():  # partition pruning of the store is fast already
+            return cls(read_picks(picks, columns=columns))
+        path = str(picks.resolve())
+        mtime = picks.stat().st_mtime
+        columns = None if columns is None else tuple(columns)
+        cached = _index_cache.get(path)
+        if cached is not None and cached[:2] == (mtime, columns):
+            return cached[2]
+        index = cls._load_sorted(picks, cache_dir)
+        if columns is not None:
+            index.picks = index.picks[[c for c in columns if c in index.picks]]
+        _index_cache[path] = (mtime, columns, index)
+        return index
+
+    @classmethod
+    def _load_sorted(cls, picks: Path, cache_dir: Path | None) -> PickIndex:
+        """Index a file, through its copy in cache_dir if there is one.
+
+        The copy is an uncompressed Arrow file that is memory-mapped, its strings
+        stay in Arrow memory until ``query`` returns them.
+        """
+        if cache_dir is None:
+            return cls(read_picks(picks))
+        key = hashlib.sha256(str(picks.resolve()).encode()).hexdigest()[:16]
+        cached = Path(cache_dir) / f'{picks.stem}-{key}.index.arrow'
+        if cached.exists() and cached.stat().st_mtime >= picks.stat().st_mtime:
+            with pa.memory_map(str(cached)) as source:
+                table = pa.ipc.open_file(source).read_all()
+            df = table.to_pandas(types_mapper=_arrow_strings)
+            return cls(df.drop(columns=['_index_time']), df['_index_time'].to_numpy())
+        index = cls(read_picks(picks))
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            table = pa.Table.from_pandas(
+                index.picks.assign(_index_time=index._times), preserve_index=False
+            )
+            feather.write_feather(table, str(cached), compression='uncompressed')
+        except OSError as e:
+            logging.warning(f'Could not save the pick index {cached}: {e}')
+        return index
+
+    def query(
+        self,
+        start: str | None = None,
+        end: str | None = None,
+        stations: list | None = None,
+        phase: str | list | None = None,
+        datetimes: bool = False,
+    ) -> pd.DataFrame:
+        """## Picks with start <= phase_time <= end on the given stations and phases.
+
+        ### Args:
+            - start (str | None, optional): Earliest phase_time. If None, no lower bound. Defaults to None.
+            - end (str | None, optional): Latest phase_time. If None, no upper bound. Defaults to None.
+            - stations (list | None, optional): station_id to keep. If None, all stations. Defaults to None.
+            - phase (str | list | None, optional): phase_type to keep. If None, all phases. Defaults to None.
+            - datetimes (bool, optional): Whether to return phase_time as datetime64 instead of its original values, without parsing the strings again. Defaults to False.
+        """
+        lo = 0
+        hi = len(self._times)
+        if start is not None:
+            lo = np.searchsorted(self._times, pd.Timestamp(start).to_datetime64())
+        if end is not None:
+            end = pd.Timestamp(end).to_datetime64()
+            hi = np.searchsorted(self._times, end, side='right')
+        df = self.picks.iloc[lo:hi]
+        times = self._times[lo:hi]
+        for column, values in [('station_id', stations), ('phase_type', phase)]:
+            if values is None:
+                continue
+            if isinstance(values, str):
+                values = [values]
+            codes = df[column].cat.categories.get_indexer(list(values))
+            mask = np.isin(df[column].cat.codes.to_numpy(), codes[codes >= 0])
+            df, times = df[mask], times[mask]
+        df = df.reset_index(drop=True).copy()
+        if datetimes:
+            df['phase_time'] = times
+        # callers get the original value types back
+        for column in df.columns:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype(df[column].cat.categories.dtype)
+            elif isinstance(df[column].dtype, pd.ArrowDtype):
+                df[column] = df[column].astype(object)
+        return df
+
+    def stations(self) -> list:
+        """## All the station_id in the picks."""
+        return self.picks['station_id'].cat.categories.tolist()
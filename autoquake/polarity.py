@@ -3,6 +3,7 @@ from __future__ import annotations
 import logging
 import multiprocessing as mp
 import os
+import time
 import warnings
 from datetime import datetime
 from pathlib import Path
@@ -13,6 +14,8 @@ import onnxruntime as ort
 import pandas as pd
 from obspy import Stream, UTCDateTime, read
 
+from .registry import ModelRegistry
+
 diting_model = (
     Path(__file__).parents[1].resolve() / 'focal_model' / 'DiTingMotionJul.onnx'
 )
@@ -76,6 +79,7 @@ class DitingMotion:
         interval=300,
         sampling_rate=100.0,
         type_judge=None,
+        model_dir: Path | None = None,
     ):
         """## Using DitingMotion to predict the polarity of the P-wave
 
@@ -88,9 +92,11 @@ class DitingMotion:
             - interval: Interval of the h5 data to be used for searching specific 300s data.
             - sampling_rate: Sampling rate of the data.
             - type_judge: Function to judge the type of the station through name.
+            - model_dir: Directory of the model registry, the same as PhaseNet's model_dir. If None, $AUTOQUAKE_MODEL_DIR or model_registry in the repo is used.
         """
         self.gamma_picks = gamma_picks
-        self.model_path = model_path
+        ModelRegistry(model_dir).record(model_path)
+        self.model_path = str(model_path)
         self.output_dir = self._check_output(output_dir)
         self.sac_parent_dir = sac_parent_dir
         self.h5_parent_dir = h5_parent_dir
@@ -123,12 +129,16 @@ class DitingMotion:
         Initializer for each worker in the pool. Loads the ONNX model once per process.
         """
         global model_session
+        start = time.perf_counter()
         session_options = ort.SessionOptions()
         session_options.intra_op_num_threads = 1
         session_options.inter_op_num_threads = 1
         os.environ["OMP_NUM_THREADS"] = "4"  # Adjust based on CPU cores
         os.environ["MKL_NUM_THREADS"] = "4"
         model_session = ort.InferenceSession(self.model_path, sess_options=session_options)
+        logging.info(
+            f'Worker {os.getpid()} started in {time.perf_counter() - start:.2f} s'
+        )
 
     def _get_indices(self):
         df = pd.read_csv(self.gamma_picks)
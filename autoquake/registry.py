@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+# Pretrained weights of the pickers, keyed by (model, location).
+model_urls = {
+    ('phasenet', None): 'https://github.com/AI4EPS/models/releases/download/PhaseNet-v1/model_99.pth',
+    ('phasenet_plus', None): 'https://github.com/AI4EPS/models/releases/download/PhaseNet-Plus-v1/model_99.pth',
+    ('phasenet_plus', 'LCSN'): 'https://github.com/AI4EPS/models/releases/download/PhaseNet-Plus-LCSN/model_99.pth',
+    ('phasenet_das', None): 'https://github.com/AI4EPS/models/releases/download/PhaseNet-DAS-v1/PhaseNet-DAS-v1.pth',
+    ('phasenet_das', 'forge'): 'https://github.com/AI4EPS/models/releases/download/PhaseNet-DAS-ConvertedPhase/model_99.pth',
+}
+
+# Published sha256 of the files in model_urls, keyed the same way. A download is
+# only accepted when it matches. None of the releases publishes a digest yet, so
+# this is empty: downloads are trusted on first use, i.e. they must load as a
+# checkpoint and their hash is recorded, which only detects later changes.
+model_sha256: dict = {}
+
+
+def _sha256(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ModelRegistry:
+    """## Local directory of the model artifacts used by AutoQuake.
+
+    Artifacts are stored as ``{root}/{model}/{location}/{file}``. The hash of every
+    downloaded file is recorded in ``registry.json`` (and checked against
+    ``model_sha256`` where a digest is pinned), so ``verify`` refuses a download
+    that changed on disk. Files of the user, e.g. a retrained checkpoint, are
+    only recorded: ``record`` hashes them again when they change. Files are only
+    re-hashed when their size or mtime changed. Checkpoints are loaded
+    memory-mapped, so the workers of one node share the pages of the same file.
+
+    ### Args:
+        - root (Path | None, optional): Registry directory. If None, $AUTOQUAKE_MODEL_DIR or model_registry in the repo is used. Defaults to None.
+    """
+
+    def __init__(self, root: Path | None = None):
+        if root is None:
+            root = os.environ.get(
+                'AUTOQUAKE_MODEL_DIR',
+                Path(__file__).parents[1].resolve() / 'model_registry',
+            )
+        self.root = Path(root).resolve()
+        self.record_file = self.root / 'registry.json'
+
+    def _records(self) -> dict:
+        if not self.record_file.exists():
+            return {}
+        with open(self.record_file) as f:
+            return json.load(f)
+
+    def _save_records(self, records: dict):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.record_file.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(records, f, indent=4)
+        os.replace(tmp, self.record_file)
+
+    def _hash(self, path: Path) -> tuple[str, dict | None, bool]:
+        """sha256 of a file, its record and whether it changed since the record.
+
+        Only a file whose size or mtime differs from its record is hashed again.
+        """
+        stat = path.stat()
+        record = self._records().get(str(path))
+        if (
+            record is not None
+            and record['size'] == stat.st_size
+            and record['mtime'] == stat.st_mtime
+        ):
+            return record['sha256'], record, False
+        return _sha256(path), record, True
+
+    def _save_hash(self, path: Path, sha256: str):
+        stat = path.stat()
+        records = self._records()
+        records[str(path)] = {
+            'sha256': sha256,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+        }
+        self._save_records(records)
+        logging.info(f'Registered {path} (sha256 {sha256[:12]})')
+
+    def record(self, path: Path) -> str:
+        """## Record the sha256 of a file of the user and return it.
+
+        The file may change, e.g. a checkpoint that is trained again, its new hash
+        then replaces the recorded one instead of refusing the file.
+        """
+        path = Path(path).resolve()
+        sha256, record, changed = self._hash(path)
+        if changed:
+            if record is not None and record['sha256'] != sha256:
+                logging.info(f'{path} changed since it was recorded')
+            self._save_hash(path, sha256)
+        return sha256
+
+    def verify(self, path: Path, sha256: str | None = None) -> Path:
+        """## Check a downloaded artifact against its pinned or recorded sha256.
+
+        A file seen for the first time is recorded once it matches. A file whose
+        content changed after it was recorded is refused and its record kept.
+
+        ### Args:
+            - path (Path): File to check.
+            - sha256 (str | None, optional): Pinned sha256. If None, the one recorded in the registry, if any. Defaults to None.
+        """
+        path = Path(path).resolve()
+        actual, record, changed = self._hash(path)
+        expected = sha256 or (None if record is None else record['sha256'])
+        if expected is not None and actual != expected:
+            raise ValueError(
+                f'{path} does not match its sha256 {expected}, please check the file'
+            )
+        if changed:
+            self._save_hash(path, actual)
+        return path
+
+    def path(self, model: str, location: str | None = None) -> Path:
+        """## Local path of the pretrained weights of a picker."""
+        if (model, location) not in model_urls:
+            raise ValueError(f'Missing pretrained model of {model} for {location}')
+        url = model_urls[(model, location)]
+        return self.root / model / (location or 'default') / url.split('/')[-1]
+
+    def fetch(self, model: str, location: str | None = None) -> Path:
+        """## Download the weights of a picker if needed and verify them.
+
+        The download goes to a temporary file and is only moved into the registry
+        once it matches the pinned sha256. Without a pinned value (currently every
+        model, see ``model_sha256``) it must at least load as a checkpoint before
+        its hash is recorded.
+        """
+        path = self.path(model, location)
+        sha256 = model_sha256.get((model, location))
+        if not path.exists():
+            from torch.hub import download_url_to_file
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f'.{os.getpid()}.part')
+            try:
+                download_url_to_file(model_urls[(model, location)], str(tmp))
+                if sha256 is not None and _sha256(tmp) != sha256:
+                    raise ValueError(
+                        f'Download of {model} ({location}) does not match its '
+                        f'pinned sha256 {sha256}'
+                    )
+                if sha256 is None:
+                    logging.warning(
+                        f'No pinned sha256 for {model} ({location}), '
+                        'recording the hash of the downloaded file'
+                    )
+                    self.load_checkpoint(tmp)
+                os.replace(tmp, path)
+            finally:
+                tmp.unlink(missing_ok=True)
+        return self.verify(path, sha256)
+
+    @staticmethod
+    def load_checkpoint(path: Path) -> dict:
+        """## Load a checkpoint with memory-mapped tensors."""
+        import torch
+
+        start = time.perf_counter()
+        try:
+            checkpoint = torch.load(
+                path, map_location='cpu', mmap=True, weights_only=False
+            )
+        except RuntimeError:  # legacy (non-zip) checkpoints can not be mmap-ed
+            checkpoint = torch.load(path, map_location='cpu', weights_only=False)
+        logging.info(
+            f'Loaded {path} in pid {os.getpid()} ({time.perf_counter() - start:.2f} s)'
+        )
+        return checkpoint
@@ -84,6 +84,7 @@ def run_autoquake(
                     sac_parent_dir=data_parent_dir,
                     output_dir=result_path,
                     type_judge=type_judge,
+                    model_dir=picker.model_dir,
                 )
             elif picker.format == 'h5':
                 dt_focal = DitingMotion(
@@ -91,6 +92,7 @@ def run_autoquake(
                     h5_parent_dir=data_parent_dir,
                     output_dir=result_path,
                     type_judge=type_judge,
+                    model_dir=picker.model_dir,
                 )
             dt_focal.run_parallel_predict(processes=3)
             polarity_picks = dt_focal.picks
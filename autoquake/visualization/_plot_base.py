@@ -3,7 +3,9 @@ import logging
 import math
 from collections import defaultdict
 from datetime import datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
 from pathlib import Path
+from typing import Any
 
 import cartopy.crs as ccrs
 import h5py
@@ -11,7 +13,6 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import pygmt
-from pyproj import Geod
 from cartopy.mpl.geoaxes import GeoAxes
 from geopy.distance import geodesic
 from matplotlib.axes import Axes
@@ -19,11 +20,13 @@ from matplotlib.colors import LightSource, Normalize
 from matplotlib.gridspec import GridSpec
 from matplotlib.ticker import MultipleLocator
 from obspy import Stream, Trace, UTCDateTime, read
+from pyproj import Geod
 from pyrocko import moment_tensor as pmt
 from pyrocko.plot import beachball, mpl_color
 from scipy.interpolate import griddata
-from typing import Any 
-from decimal import Decimal, ROUND_HALF_UP
+
+from autoquake.pickstore import PickIndex, index_dir
+
 
 # ===== Sauce =====
 def add_on_utc_time(time: str, delta: float) -> str:
@@ -441,10 +444,12 @@ def _preprocess_phasenet_csv(
     """## Preprocess the phasenet_csv
     Using get_station to retrieve the station name in station_id column.
     """
-    df_all_picks = pd.read_csv(phasenet_picks)
-    df_all_picks['phase_time'] = pd.to_datetime(df_all_picks['phase_time'])
+    index = PickIndex.open(phasenet_picks, cache_dir=index_dir(phasenet_picks))
+    # the pick search below compares phase_time with pd.Timestamp
     if starttime is not None and endtime is not None:
-        df_all_picks = df_all_picks[(df_all_picks['phase_time']>=pd.Timestamp(starttime)) & (df_all_picks['phase_time']<=pd.Timestamp(endtime))]
+        df_all_picks = index.query(starttime, endtime, datetimes=True)
+    else:
+        df_all_picks = index.query(datetimes=True)
     df_all_picks['total_seconds'] = df_all_picks['phase_time'].apply(get_total_seconds)
     # df_all_picks['system'] = df_all_picks['station_id'].apply(
     #     lambda x: str(x).split('.')[0]
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyproj')
+associator = pytest.importorskip('autoquake.associator')
+GaMMA = associator.GaMMA
+
+
+@pytest.fixture
+def gamma():
+    gamma = GaMMA.__new__(GaMMA)
+    gamma.dedup_seconds = 2.0
+    gamma.dedup_km = 5.0
+    return gamma
+
+
+def _event(index, time, x=0.0, num_picks=5):
+    return {
+        'event_index': index,
+        'time': time,
+        'x(km)': x,
+        'y(km)': 0.0,
+        'z(km)': 10.0,
+        'num_picks': num_picks,
+    }
+
+
+def test_merge_windows_drops_duplicates_and_renumbers(gamma):
+    first = (
+        [_event(0, '2024-01-01T00:59:00'), _event(1, '2024-01-01T00:59:50')],
+        [(0, 0, 0.9), (1, 1, 0.5), (2, 1, 0.8)],
+    )
+    # the overlap finds the second event again with more picks, a third far away
+    second = (
+        [
+            _event(0, '2024-01-01T00:59:51', x=1.0, num_picks=8),
+            _event(1, '2024-01-01T00:59:51', x=50.0),
+        ],
+        [(1, 0, 0.7), (2, 0, 0.6), (3, 1, 0.9)],
+    )
+    events, assignments = gamma._merge_windows([first, second])
+
+    assert [event['time'] for event in events] == [
+        '2024-01-01T00:59:00',
+        '2024-01-01T00:59:51',
+        '2024-01-01T00:59:51',
+    ]
+    assert [event['num_picks'] for event in events] == [5, 8, 5]
+    assert [event['event_index'] for event in events] == [0, 1, 2]
+    # the picks of the dropped event go to the kept one
+    assert assignments == [(0, 0, 0.9), (1, 1, 0.7), (2, 1, 0.6), (3, 2, 0.9)]
+
+
+def test_merge_windows_without_events(gamma):
+    assert gamma._merge_windows([([], []), ([], [])]) == ([], [])
+
+
+def test_duplicated_events_keep_events_of_the_same_window(gamma):
+    events = pd.DataFrame(
+        [
+            _event(0, '2024-01-01T00:00:00.000'),
+            _event(1, '2024-01-01T00:00:01.000', x=1.0, num_picks=9),
+        ]
+    )
+    events['origin'] = pd.to_datetime(events['time'])
+    events['window'] = [0, 0]
+    assert gamma._duplicated_events(events).tolist() == [False, False]
+    events['window'] = [0, 1]
+    assert gamma._duplicated_events(events).tolist() == [True, False]
+
+
+def test_duplicated_events_matches_pairwise_loop(gamma):
+    rng = np.random.default_rng(0)
+    n = 200
+    events = pd.DataFrame(
+        {
+            'origin': pd.Timestamp('2024-01-01')
+            + pd.to_timedelta(np.sort(rng.uniform(0, 120, n)), unit='s'),
+            'x(km)': rng.uniform(0, 10, n),
+            'y(km)': rng.uniform(0, 10, n),
+            'z(km)': rng.uniform(0, 10, n),
+            'window': rng.integers(0, 3, n),
+            'num_picks': rng.integers(3, 10, n),
+        }
+    )
+    expected = np.zeros(n, dtype=bool)
+    for i in range(n):
+        for j in range(i + 1, n):
+            if expected[i]:
+                break
+            dt = (events['origin'][j] - events['origin'][i]).total_seconds()
+            distance = np.linalg.norm(
+                events.loc[j, ['x(km)', 'y(km)', 'z(km)']].to_numpy(float)
+                - events.loc[i, ['x(km)', 'y(km)', 'z(km)']].to_numpy(float)
+            )
+            if (
+                dt <= gamma.dedup_seconds
+                and not expected[j]
+                and events['window'][j] != events['window'][i]
+                and distance <= gamma.dedup_km
+            ):
+                num_picks = events['num_picks']
+                expected[j if num_picks[i] >= num_picks[j] else i] = True
+    assert gamma._duplicated_events(events).tolist() == expected.tolist()
+
+
+def test_count_event_picks_matches_classify_event():
+    rng = np.random.default_rng(1)
+    stations = ['TW.SSS01..HH', 'TW.ABC..EH', 'A0001', 'B0120', 'TW.XYZ..HH']
+    picks = pd.DataFrame(
+        {
+            'event_index': rng.integers(-1, 6, 300),
+            'station_id': rng.choice(stations, 300),
+            'phase_type': rng.choice(['P', 'S'], 300),
+        }
+    )
+    counts = GaMMA.count_event_picks(picks)
+    columns = ['seis_p_picks', 'seis_s_picks', 'das_p_picks', 'das_s_picks']
+    for event_index in range(6):
+        row = GaMMA.classify_event(pd.Series({'event_index': event_index}), picks)
+        assert counts.loc[event_index, columns].tolist() == row[columns].tolist()
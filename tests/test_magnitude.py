@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+obspy = pytest.importorskip('obspy')
+from obspy import Stream, Trace, UTCDateTime  # noqa: E402
+
+from autoquake.magnitude import Magnitude, peak_amplitudes  # noqa: E402
+
+START = UTCDateTime('2024-04-01T00:00:00')
+P_TIME = START + 300
+S_TIME = P_TIME + 10
+
+PZ = """ZEROS 3
+POLES 2
+-4.44 4.44
+-4.44 -4.44
+CONSTANT 1.0e9
+"""
+
+
+def _trace(channel, seed):
+    rng = np.random.default_rng(seed)
+    data = rng.normal(0, 50, 600 * 100)
+    t = np.arange(len(data)) / 100
+    data += 5e3 * np.exp(-((t - 305) ** 2) / 4) * np.sin(2 * np.pi * 5 * t)
+    header = {
+        'network': 'TW',
+        'station': 'SSS1',
+        'channel': channel,
+        'starttime': START,
+        'sampling_rate': 100.0,
+    }
+    return Trace(data=data.astype(np.int32), header=header)
+
+
+@pytest.fixture
+def stream():
+    return Stream([_trace('HHE', 1), _trace('HHN', 2)])
+
+
+@pytest.fixture
+def magnitude(tmp_path, stream, monkeypatch):
+    for channel in ['HHE', 'HHN']:
+        (tmp_path / f'SAC_PZs_TW_SSS1_{channel}').write_text(PZ)
+    magnitude = Magnitude.__new__(Magnitude)
+    magnitude.pz_path = tmp_path
+    magnitude.amplitudes = None
+
+    def merge_latest(station, comp, t1, t2, tt1=None, tt2=None):
+        return stream.select(channel=comp).copy()
+
+    monkeypatch.setattr(magnitude, '_merge_latest', merge_latest)
+    return magnitude
+
+
+def _baseline(magnitude, monkeypatch, t1, t2):
+    """Threshold inputs and code 1/2 amplitudes as Magnitude computes them."""
+    seen = {}
+
+    def threshold_code(station, comp, max_amp, max_detrend_amp):
+        seen.update(amp=max_amp, amp_detrend=max_detrend_amp)
+        return 1
+
+    monkeypatch.setattr(magnitude, '_threshold_code', threshold_code)
+    magnitude._kinethreshold({'HHE', 'HHN'}, 'SSS1', t1, t2)
+    for code in [1, 2]:
+        response = magnitude._find_max_amp(
+            code, ['HHE', 'HHN'], 'SSS1', t1, t2, t1 - 100, t2 + 100, mn=1
+        )
+        seen[code] = [response[0], response[1]]
+    return seen
+
+
+def test_peak_amplitudes_match_magnitude(magnitude, stream, tmp_path, monkeypatch):
+    df = peak_amplitudes(
+        stream, [P_TIME, S_TIME], pz_dir=tmp_path, phase_types=['P', 'S']
+    )
+    assert df['instrument'].tolist() == ['HH', 'HH']
+    assert df['pair_time'].iloc[0] == pd.Timestamp(S_TIME.datetime)
+    assert pd.isna(df['pair_time'].iloc[1])
+
+    windows = [(0, '20', 20), (0, '80', 80), (0, 'pair', 25), (1, '30', 30)]
+    for row, suffix, length in windows:
+        t1 = [P_TIME, S_TIME][row] - 3
+        expected = _baseline(magnitude, monkeypatch, t1, t1 + length)
+        got = df.iloc[row]
+        assert got[f'amp_{suffix}'] == pytest.approx(expected['amp'])
+        assert got[f'amp_detrend_{suffix}'] == pytest.approx(expected['amp_detrend'])
+        assert [got[f'wa_amp_e_{suffix}'], got[f'wa_amp_n_{suffix}']] == (
+            pytest.approx(expected[1], rel=1e-6)
+        )
+        assert [got[f'wa_bp_amp_e_{suffix}'], got[f'wa_bp_amp_n_{suffix}']] == (
+            pytest.approx(expected[2], rel=1e-6)
+        )
+
+
+def test_peak_amplitudes_leave_uncovered_windows_empty(stream, tmp_path):
+    df = peak_amplitudes(stream, [START + 590], pz_dir=tmp_path)
+    assert df[['amp_20', 'wa_amp_e_20', 'pair_time']].isna().all(axis=None)
+
+
+def _station_picks(phases):
+    return pd.DataFrame(
+        {
+            'phase_type': list(phases),
+            'phase_time': [pd.Timestamp(t.datetime) for t in phases.values()],
+            'dist': 50.0,
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    ('phases', 'dist', 'window'),
+    [
+        ({'P': P_TIME, 'S': S_TIME}, 50.0, ('P', 'pair')),
+        ({'P': P_TIME, 'S': P_TIME + 40}, 50.0, ('P', '80')),
+        ({'P': P_TIME}, 150.0, ('P', '40')),
+        ({'P': P_TIME}, 300.0, ('P', '80')),
+        ({'S': S_TIME}, 50.0, ('S', '30')),
+    ],
+)
+def test_stored_window(magnitude, phases, dist, window):
+    df = _station_picks(phases).assign(dist=dist)
+    assert magnitude._stored_window(df) == window
+
+
+@pytest.mark.parametrize('code', [1, 2])
+def test_stored_response_uses_the_pair_and_code(
+    magnitude, stream, tmp_path, monkeypatch, code
+):
+    df = peak_amplitudes(
+        stream, [P_TIME, S_TIME], pz_dir=tmp_path, phase_types=['P', 'S']
+    )
+    df['phase_time'] = [pd.Timestamp(P_TIME.datetime), pd.Timestamp(S_TIME.datetime)]
+    df['phase_type'] = ['P', 'S']
+    magnitude.amplitudes = {
+        ('SSS1', phase): group.reset_index(drop=True)
+        for phase, group in df.groupby('phase_type')
+    }
+    monkeypatch.setattr(magnitude, '_threshold_code', lambda *args: code)
+
+    picks = _station_picks({'P': P_TIME, 'S': S_TIME})
+    stored_code, response = magnitude._stored_response(picks, 'SSS1', mn=1)
+    name = 'wa_amp' if code == 1 else 'wa_bp_amp'
+    assert stored_code == code
+    assert response == {0: df[f'{name}_e_pair'][0], 1: df[f'{name}_n_pair'][0]}
+
+    # another S pick than the one the picker paired reads the waveforms
+    picks = _station_picks({'P': P_TIME, 'S': S_TIME + 5})
+    assert magnitude._stored_response(picks, 'SSS1') is None
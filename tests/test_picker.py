@@ -0,0 +1,75 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+picker = pytest.importorskip('autoquake.picker')
+
+
+def _sample(i, nt):
+    return {
+        'data': torch.ones(3, nt, 1),
+        'file_name': f'TW.SSS{i:02d}..HH*.mseed',
+        'nt': nt,
+        'nx': 1,
+    }
+
+
+def test_pad_collate_pads_to_the_longest_trace():
+    meta = picker._pad_collate([_sample(0, 100), _sample(1, 300), _sample(2, 200)])
+    assert meta['data'].shape == (3, 3, 300, 1)
+    assert meta['nt'] == 300
+    assert meta['nx'] == 1
+    assert meta['valid_nt'].tolist() == [100, 300, 200]
+    assert meta['file_name'] == [f'TW.SSS{i:02d}..HH*.mseed' for i in range(3)]
+    assert meta['data'][0, :, 100:].abs().sum() == 0
+    assert meta['data'][2, :, :200].min() == 1
+
+
+def test_dynamic_batches_stay_within_the_budget():
+    samples = [_sample(0, 100), _sample(1, 300), _sample(2, 200)]
+    # a batch costs (stations x longest trace) float32 samples times the factor
+    budget = 2 * 3 * 300 * 4 * 2.0
+    batches = list(picker._dynamic_batches(samples, budget, factor=2.0))
+    assert [len(meta['valid_nt']) for meta in batches] == [2, 1]
+    assert [meta['nt'] for meta in batches] == [300, 200]
+
+
+def test_dynamic_batches_keep_a_sample_over_the_budget():
+    samples = [_sample(0, 100), _sample(1, 300)]
+    batches = list(picker._dynamic_batches(samples, 1, factor=64.0))
+    assert [meta['valid_nt'].tolist() for meta in batches] == [[100], [300]]
+
+
+def _bursts(nt, starts, length=100):
+    data = torch.ones(1, 3, nt, 2)
+    for start in starts:
+        data[0, :, start : start + length, 1] = 10.0
+    return data
+
+
+def _segments(data):
+    return picker._trigger_segments(
+        data, nsta=100, nlta=1000, threshold=3.0, npad=500, multiple=1024
+    )
+
+
+def test_trigger_segments_cover_a_burst():
+    segments = _segments(_bursts(20000, [5000]))
+    assert len(segments) == 1
+    start, end = segments[0]
+    # the window opens npad samples before the first trigger, inside the burst
+    assert 5000 - 500 <= start < 5000
+    assert end >= 5100 + 500
+    assert (end - start) % 1024 == 0
+    assert end <= 20000
+
+
+def test_trigger_segments_merge_close_bursts_and_split_far_ones():
+    assert len(_segments(_bursts(20000, [5000, 5600]))) == 1
+    segments = _segments(_bursts(20000, [3000, 15000]))
+    assert len(segments) == 2
+    assert segments[0][1] < segments[1][0]
+
+
+def test_trigger_segments_of_quiet_and_short_data():
+    assert _segments(torch.ones(1, 3, 20000, 2)) == []
+    assert _segments(torch.ones(1, 3, 800, 2)) == [(0, 800)]
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from autoquake import pickstore
+from autoquake.pickstore import PickIndex, index_dir
+
+
+@pytest.fixture
+def picks_csv(tmp_path):
+    path = tmp_path / 'picks.csv'
+    pd.DataFrame(
+        {
+            'station_id': ['TW.B..HH', 'TW.A..HH', 'TW.A..HH', 'TW.C..HH'],
+            'phase_time': [
+                '2024-01-01T00:00:03.000',
+                '2024-01-01T00:00:01.000',
+                '2024-01-01T00:00:02.500',
+                '2024-01-01T00:00:04.000',
+            ],
+            'phase_score': [0.5, 0.6, 0.7, 0.8],
+            'phase_type': ['S', 'P', 'S', 'P'],
+        }
+    ).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(autouse=True)
+def no_process_cache():
+    pickstore._index_cache.clear()
+    yield
+    pickstore._index_cache.clear()
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_query_keeps_original_types(picks_csv, cached):
+    cache_dir = index_dir(picks_csv)
+    PickIndex.open(picks_csv, cache_dir=cache_dir)
+    pickstore._index_cache.clear()  # a later run reads the cached index
+    index = PickIndex.open(picks_csv, cache_dir=cache_dir if cached else None)
+    assert any(cache_dir.iterdir())
+
+    df = index.query('2024-01-01T00:00:02', '2024-01-01T00:00:04')
+    assert df['phase_time'].tolist() == [
+        '2024-01-01T00:00:02.500',
+        '2024-01-01T00:00:03.000',
+        '2024-01-01T00:00:04.000',
+    ]
+    assert df['phase_time'].dtype == object
+    assert df['station_id'].dtype == object
+    assert df['phase_type'].dtype == object
+
+
+def test_query_datetimes(picks_csv):
+    index = PickIndex.open(picks_csv)
+    df = index.query(stations=['TW.A..HH'], phase='S', datetimes=True)
+    assert df['phase_time'].tolist() == [pd.Timestamp('2024-01-01T00:00:02.500')]
+    assert df['phase_time'].dtype.kind == 'M'
+    assert (df['phase_time'] >= pd.Timestamp('2024-01-01')).all()
+
+
+def test_query_stations_and_phases(picks_csv):
+    index = PickIndex.open(picks_csv)
+    assert index.stations() == ['TW.A..HH', 'TW.B..HH', 'TW.C..HH']
+    df = index.query(stations=['TW.A..HH', 'TW.X..HH'])
+    assert df['phase_score'].tolist() == [0.6, 0.7]
+    assert index.query(phase='P')['station_id'].tolist() == ['TW.A..HH', 'TW.C..HH']
+    assert index.query(stations=['TW.X..HH']).empty
+
+
+def test_open_reindexes_a_changed_file(picks_csv):
+    cache_dir = index_dir(picks_csv)
+    assert len(PickIndex.open(picks_csv, cache_dir=cache_dir).query()) == 4
+    df = pd.read_csv(picks_csv).iloc[:2]
+    df.to_csv(picks_csv, index=False)
+    assert len(PickIndex.open(picks_csv, cache_dir=cache_dir).query()) == 2
@@ -0,0 +1,91 @@
+import pandas as pd
+import pytest
+
+from autoquake.pickstore import PickStore, read_picks
+
+
+def _picks(times, station='TW.SSS01..HH', phase='P'):
+    return pd.DataFrame(
+        {
+            'station_id': station,
+            'phase_time': times,
+            'phase_score': 0.9,
+            'phase_type': phase,
+        }
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PickStore(tmp_path / 'store', name='20240101_0000')
+    store.append(
+        _picks(
+            [
+                '2024-01-01T23:59:58.000',
+                '2024-01-02T00:00:01.500',
+                '2024-01-02T12:00:00.000',
+                '2024-01-03T06:00:00.000',
+            ]
+        )
+    )
+    store.flush()
+    return store
+
+
+def test_flush_writes_one_named_part_per_day(store):
+    parts = sorted(p.relative_to(store.root) for p in store.root.rglob('*.parquet'))
+    assert [str(p.parent) for p in parts] == [
+        'date=20240101',
+        'date=20240102',
+        'date=20240103',
+    ]
+    assert all(p.name == 'part-20240101_0000-00000.parquet' for p in parts)
+
+
+def test_read_by_date_range(store):
+    df = store.read(start='2024-01-02T00:00:00', end='2024-01-02T23:59:59')
+    assert df['phase_time'].tolist() == [
+        pd.Timestamp('2024-01-02T00:00:01.500'),
+        pd.Timestamp('2024-01-02T12:00:00'),
+    ]
+    assert 'date' not in df
+
+
+def test_read_picks_of_store_by_date_range(store):
+    df = read_picks(store.root, columns=['phase_time'], start='2024-01-02T06:00')
+    assert len(df) == 2
+    assert list(df.columns) == ['phase_time']
+
+
+def test_read_by_dates_and_stations(store):
+    assert len(store.read(dates=['20240101', 20240103])) == 2
+    assert store.read(stations=['TW.XXX..HH']).empty
+
+
+def test_append_flushes_at_flush_rows(tmp_path):
+    store = PickStore(tmp_path / 'store', flush_rows=2)
+    assert not store.append(_picks(['2024-01-01T00:00:00']))
+    assert store.append(_picks(['2024-01-01T00:00:01']))
+    assert store.buffered_rows == 0
+    assert len(store.read()) == 2
+
+
+def test_rerun_replaces_the_parts_of_the_task(store):
+    rerun = PickStore(store.root, name=store.name)
+    rerun.clear()
+    rerun.append(_picks(['2024-01-01T10:00:00']))
+    rerun.flush()
+    assert len(store.read()) == 1
+
+
+def test_prune_keeps_current_tasks_and_other_days(store):
+    other = PickStore(store.root, name='20240101_0001')
+    other.append(_picks(['2024-01-01T01:00:00'], phase='S'))
+    other.flush()
+    later = PickStore(store.root, name='20240105_0000')
+    later.append(_picks(['2024-01-05T01:00:00']))
+    later.flush()
+
+    store.prune(days={'20240101'}, keep={'20240101_0001'})
+    df = store.read()
+    assert df['phase_type'].tolist() == ['S', 'P']
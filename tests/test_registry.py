@@ -0,0 +1,63 @@
+import hashlib
+import os
+
+import pytest
+
+from autoquake import registry as registry_module
+from autoquake.registry import ModelRegistry
+
+
+def _write(path, content: bytes, mtime=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return ModelRegistry(tmp_path / 'registry')
+
+
+def test_verify_records_and_refuses_a_changed_download(registry):
+    path = _write(registry.path('phasenet'), b'weights', mtime=1_000)
+    assert registry.verify(path) == path.resolve()
+    _write(path, b'tampered', mtime=2_000)
+    with pytest.raises(ValueError, match='does not match'):
+        registry.verify(path)
+    # the accepted hash stays on record
+    with pytest.raises(ValueError):
+        registry.verify(path)
+
+
+def test_verify_accepts_a_touched_download(registry):
+    path = _write(registry.path('phasenet'), b'weights', mtime=1_000)
+    registry.verify(path)
+    os.utime(path, (2_000, 2_000))
+    registry.verify(path)
+
+
+def test_fetch_checks_the_pinned_sha256(registry, monkeypatch):
+    path = _write(registry.path('phasenet_plus', 'LCSN'), b'weights')
+    pinned = {('phasenet_plus', 'LCSN'): hashlib.sha256(b'weights').hexdigest()}
+    monkeypatch.setattr(registry_module, 'model_sha256', pinned)
+    assert registry.fetch('phasenet_plus', 'LCSN') == path.resolve()
+
+    _write(path, b'tampered')
+    with pytest.raises(ValueError, match='does not match'):
+        registry.fetch('phasenet_plus', 'LCSN')
+
+
+def test_record_follows_a_retrained_checkpoint(registry, tmp_path):
+    checkpoint = _write(tmp_path / 'mine.pth', b'epoch 1', mtime=1_000)
+    first = registry.record(checkpoint)
+    assert first == hashlib.sha256(b'epoch 1').hexdigest()
+    _write(checkpoint, b'epoch 2', mtime=2_000)
+    assert registry.record(checkpoint) == hashlib.sha256(b'epoch 2').hexdigest()
+    assert registry.record(checkpoint) != first
+
+
+def test_unknown_model(registry):
+    with pytest.raises(ValueError, match='Missing pretrained model'):
+        registry.path('phasenet', 'nowhere')